@@ -0,0 +1,329 @@
+#!/usr/bin/python3
+
+"""
+This module implements a position analysis server: dashboards, replay
+tools and bots send it Hex positions over a socket, and it answers
+with the value of the positions and their best moves, as evaluated by
+a single, warm evaluator.Evaluator.
+
+The protocol is line based. A client sends
+
+    Analyze <board> [<player to move>]
+
+where <board> is serialized as in the game protocol (the player to
+move is deduced from the stone counts by default), and receives
+
+    Analysis <value> <row>#<col>:<prior> ...
+
+with the probability of winning of the player to move, and the best
+moves (at most --top), by decreasing prior. Invalid positions are
+answered by "InvalidPosition", and "Stats" returns the counters of
+the server. Requests can be pipelined: the answers are sent in the
+order of the requests.
+
+The requests of all the clients are gathered into micro-batches,
+evaluated at once by NumPy in a worker thread. The results are kept
+in a shared LRU cache keyed by Hex.canonical_key, so that a position
+is evaluated once for all its symmetries and all the clients.
+"""
+
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import socket
+import sys
+
+import numpy as np
+
+import evaluator
+import hexgame
+
+HOST = '127.0.0.1'
+PORT = 8890  # 8888 is the game server, 8889 the spectators
+BATCH_SIZE = 256
+DELAY = 0.001  # Seconds waited for more requests before a batch
+CACHE_SIZE = 100000
+TOP_MOVES = 5
+
+
+class Analyzer():
+    """
+    The Analyzer class evaluates the requested positions in batches,
+    and caches the results of their canonical positions.
+    """
+
+    def __init__(self, position_evaluator, batch_size=BATCH_SIZE,
+                 delay=DELAY, cache_size=CACHE_SIZE, top=TOP_MOVES):
+        self.evaluator = position_evaluator
+        self.batch_size = batch_size
+        self.delay = delay
+        self.cache_size = cache_size
+        self.top = top
+        # canonical key -> (value, [(cell index, prior), ...])
+        self.cache = collections.OrderedDict()
+        # The futures of the keys being evaluated
+        self.pending = {}
+        self.queue = asyncio.Queue()
+        # NumPy releases the GIL: the loop keeps reading the requests
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.requests = 0
+        self.hits = 0
+        self.batches = 0
+        self.positions = 0
+
+    @asyncio.coroutine
+    def analyze(self, hexboard):
+        """
+        This coroutine returns the value of a position and its best
+        moves, as [((row, col), prior), ...].
+        """
+        self.requests += 1
+        key, transform = hexboard.canonical_key()
+        result = self.cache.get(key)
+        if result is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+        else:
+            future = self.pending.get(key)
+            if future is None:
+                future = asyncio.get_event_loop().create_future()
+                self.pending[key] = future
+                self.queue.put_nowait(key)
+            # Other requests may wait for the same evaluation
+            result = yield from asyncio.shield(future)
+        value, moves = result
+        return value, [(hexboard.transform_move(
+            transform, *divmod(index, hexboard.size)), prior)
+                       for index, prior in moves]
+
+    @asyncio.coroutine
+    def run(self):
+        """This coroutine evaluates the queued positions, by batches."""
+        loop = asyncio.get_event_loop()
+        while True:
+            keys = [(yield from self.queue.get())]
+            if self.delay:
+                yield from asyncio.sleep(self.delay)
+            while len(keys) < self.batch_size and not self.queue.empty():
+                keys.append(self.queue.get_nowait())
+            try:
+                results = yield from loop.run_in_executor(
+                    self.executor, self.evaluate, keys)
+            except Exception as error:
+                for key in keys:
+                    self.pending.pop(key).set_exception(error)
+                continue
+            self.batches += 1
+            self.positions += len(keys)
+            for key, result in zip(keys, results):
+                self.cache[key] = result
+                self.pending.pop(key).set_result(result)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def evaluate(self, keys):
+        """
+        Evaluates canonical positions, given by their keys: one batch
+        per board size. Returns their results, in the same order.
+        """
+        by_size = collections.defaultdict(list)
+        for index, key in enumerate(keys):
+            by_size[len(key) - 1].append(index)
+        results = [None] * len(keys)
+        for cells, indices in by_size.items():
+            size = int(round(cells ** 0.5))
+            # The keys are the player to move followed by the cells
+            boards = np.frombuffer(b"".join(keys[index][1:]
+                                            for index in indices),
+                                   dtype=np.uint8).reshape(-1, size, size)
+            to_move = np.array([keys[index][0] for index in indices])
+            priors, values = self.evaluator.evaluate(boards, to_move)
+            priors = priors.reshape(len(indices), -1)
+            best = np.argsort(-priors, axis=1, kind='stable')[:, :self.top]
+            for row, index in enumerate(indices):
+                results[index] = (float(values[row]), [
+                    (int(cell), float(priors[row, cell]))
+                    for cell in best[row]
+                    if boards[row].flat[cell] == hexgame.EMPTY])
+        return results
+
+    def stats_line(self):
+        """Returns the counters of the analyzer, on one line."""
+        return ("Stats requests={} hits={} batches={} positions={} "
+                "batch={:.1f} cached={}".format(
+                    self.requests, self.hits, self.batches, self.positions,
+                    self.positions / max(self.batches, 1), len(self.cache)))
+
+
+def parse_position(fields):
+    """
+    Returns the board of an Analyze request, or None if it is invalid.
+
+    Arguments:
+    - The fields following "Analyze": the serialized board, and
+      optionally the player to move.
+    """
+    try:
+        hexboard = hexgame.Hex.create_from_str(fields[0])
+        if len(fields) > 1:
+            hexboard.current = int(fields[1])
+    except (IndexError, ValueError, AssertionError):
+        return None
+    cells = [cell for row in hexboard.grid for cell in row]
+    if (any(len(row) != hexboard.size for row in hexboard.grid)
+            or not set(cells) <= {hexgame.EMPTY, hexgame.BLUE, hexgame.RED}
+            or hexboard.current not in (hexgame.BLUE, hexgame.RED)
+            or hexgame.EMPTY not in cells):
+        return None
+    return hexboard
+
+
+def format_analysis(value, moves):
+    """Returns the Analysis answer."""
+    return "Analysis {:.4f} {}\n".format(value, " ".join(
+        "{}#{}:{:.4f}".format(i, j, prior) for (i, j), prior in moves))
+
+
+@asyncio.coroutine
+def answer(analyzer, fields):
+    """This coroutine returns the answer to a request."""
+    if fields and fields[0] == "Analyze":
+        hexboard = parse_position(fields[1:])
+        if hexboard is None:
+            return "InvalidPosition\n"
+        value, moves = yield from analyzer.analyze(hexboard)
+        return format_analysis(value, moves)
+    if fields and fields[0] == "Stats":
+        return analyzer.stats_line() + "\n"
+    return "InvalidRequest\n"
+
+
+@asyncio.coroutine
+def send_answers(writer, answers):
+    """
+    This coroutine sends the answers of a client in the order of its
+    requests, until None is received.
+    """
+    while True:
+        task = yield from answers.get()
+        if task is None:
+            break
+        message = yield from task
+        writer.write(message.encode())
+        yield from writer.drain()
+
+
+@asyncio.coroutine
+def handle_client(reader, writer, analyzer):
+    """
+    This coroutine reads the requests of a client. Each request is
+    answered by its own task, so that the pipelined requests of a
+    client are evaluated in the same batches.
+    """
+    answers = asyncio.Queue()
+    sender = asyncio.ensure_future(send_answers(writer, answers))
+    try:
+        while not sender.done():
+            data = yield from reader.readline()
+            if not data:
+                break
+            answers.put_nowait(asyncio.ensure_future(
+                answer(analyzer, data.decode().split())))
+        answers.put_nowait(None)
+        yield from sender
+    except ConnectionError:
+        pass
+    finally:
+        sender.cancel()
+        writer.close()
+
+
+class AnalysisClient():
+    """
+    The AnalysisClient class sends positions to an analysis server, for
+    the tools and players running in other processes.
+    """
+
+    def __init__(self, host=HOST, port=PORT):
+        self.socket = socket.create_connection((host, port))
+        self.stream = self.socket.makefile('rwb')
+
+    def analyze_many(self, hexboards):
+        """
+        Returns the (value, [((row, col), prior), ...]) analyses of
+        several boards (None for the invalid ones). The requests are
+        pipelined, to be evaluated in the same batches.
+        """
+        for hexboard in hexboards:
+            self.stream.write("Analyze {} {}\n".format(
+                hexboard.serialize(), hexboard.current).encode())
+        self.stream.flush()
+        return [parse_analysis(self.stream.readline().decode())
+                for _ in hexboards]
+
+    def analyze(self, hexboard):
+        """Returns the analysis of a board, see analyze_many."""
+        return self.analyze_many([hexboard])[0]
+
+    def close(self):
+        """Closes the connection."""
+        self.stream.close()
+        self.socket.close()
+
+
+def parse_analysis(message):
+    """Parses an Analysis answer, returns None for other answers."""
+    fields = message.split()
+    if not fields or fields[0] != "Analysis":
+        return None
+    moves = []
+    for field in fields[2:]:
+        move, prior = field.split(':')
+        moves.append((tuple(int(x) for x in move.split('#')), float(prior)))
+    return float(fields[1]), moves
+
+
+def main():
+    """Starts the analysis server, and serves until Ctrl+C is pressed."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', default=PORT, type=int)
+    parser.add_argument('--weights', default=evaluator.DEFAULT_WEIGHTS)
+    parser.add_argument('--batch-size', default=BATCH_SIZE, type=int,
+                        help='maximum number of positions per batch')
+    parser.add_argument('--delay', default=DELAY, type=float,
+                        help='seconds waited for more requests per batch')
+    parser.add_argument('--cache-size', default=CACHE_SIZE, type=int,
+                        help='number of cached positions')
+    parser.add_argument('--top', default=TOP_MOVES, type=int,
+                        help='number of best moves per answer')
+    options = parser.parse_args(sys.argv[1:])
+    analyzer = Analyzer(evaluator.Evaluator.load(options.weights),
+                        options.batch_size, options.delay,
+                        options.cache_size, options.top)
+    loop = asyncio.get_event_loop()
+    server = loop.run_until_complete(asyncio.start_server(
+        lambda reader, writer: handle_client(reader, writer, analyzer),
+        HOST, options.port, loop=loop))
+    batcher = loop.create_task(analyzer.run())
+
+    print('Analyzing on {}'.format(server.sockets[0].getsockname()))
+    print('Hit Ctrl+C to exit')
+    sys.stdout.flush()
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+
+    print('Closing the server')
+    print(analyzer.stats_line())
+    batcher.cancel()
+    server.close()
+    loop.run_until_complete(server.wait_closed())
+    analyzer.executor.shutdown(wait=False)
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+
+"""
+This module benchmarks the hot paths of the engine, the AI and the
+protocol on several board sizes:
+
+- play: Hex.play with win detection, per move of random games.
+- serialize: Hex.serialize / Hex.create_from_str round trips.
+- create_graph: Hex._create_graph.
+- make_graph: djikstra.make_graph on mid-game positions.
+- djikstra: one djikstra.djikstra edge-to-edge search.
+- find_best: djikstra.find_best, i.e. the choice of one move.
+- server: messages per second of a hexgame_server.py session between
+  two minimal clients.
+- redraw: hexgui.redraw frame time, rendered off-screen (skipped when
+  cairo or pygame is not installed).
+
+The results are printed as a table and can be written as JSON
+(--output); a benchmark which raises an error is recorded as failed,
+with its message, and the others still run. With --baseline, the
+results are compared to a previous JSON file, and the benchmarks
+slower than the baseline by more than --threshold are reported as
+regressions (exit status 1).
+"""
+
+
+from subprocess import Popen, DEVNULL
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import sys
+import threading
+import time
+
+import hexgame
+
+
+SIZES = [5, 7, 9, 11, 13, 15, 17, 19]
+SERVER_PATH = './hexgame_server.py'
+MIN_TIME = 0.2  # Seconds spent at least on each measure
+THRESHOLD = 0.1  # Relative slow down reported as a regression
+SERVER_GAMES = 5
+SERVER_TIMEOUT = 60  # Seconds given to a server session
+
+
+def random_game(size, rng):
+    """Returns the moves of a random game, played until the end."""
+    cells = [(i, j) for i in range(size) for j in range(size)]
+    rng.shuffle(cells)
+    hexboard = hexgame.Hex(size)
+    for count, (i, j) in enumerate(cells):
+        if hexboard.play(i, j):
+            return cells[:count + 1]
+    return cells
+
+
+def random_position(size, rng):
+    """Returns an unfinished position, half way through a random game."""
+    moves = random_game(size, rng)
+    hexboard = hexgame.Hex(size)
+    for i, j in moves[:len(moves) // 2]:
+        hexboard.play(i, j)
+    return hexboard
+
+
+def measure(function, min_time=MIN_TIME):
+    """
+    Calls function() repeatedly for at least min_time seconds, and at
+    least 3 times. Returns the median duration of a call.
+    """
+    durations = []
+    start = time.perf_counter()
+    while len(durations) < 3 or time.perf_counter() - start < min_time:
+        call_start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - call_start)
+    return statistics.median(durations)
+
+
+def bench_play(size, rng, min_time):
+    """Seconds per move of Hex.play, win detection included."""
+    games = [random_game(size, rng) for _ in range(10)]
+    moves = sum(len(game) for game in games)
+
+    def play_games():
+        for game in games:
+            hexboard = hexgame.Hex(size)
+            for i, j in game:
+                hexboard.play(i, j)
+    return measure(play_games, min_time) / moves
+
+
+def bench_serialize(size, rng, min_time):
+    """Seconds per serialize / create_from_str round trip."""
+    hexboard = random_position(size, rng)
+    return measure(lambda: hexgame.Hex.create_from_str(hexboard.serialize()),
+                   min_time)
+
+
+def bench_create_graph(size, rng, min_time):
+    """Seconds per Hex._create_graph call."""
+    hexboard = hexgame.Hex(size)
+    return measure(hexboard._create_graph, min_time)
+
+
+def bench_make_graph(size, rng, min_time):
+    """Seconds per djikstra.make_graph call."""
+    import djikstra
+    hexboard = random_position(size, rng)
+    return measure(lambda: djikstra.make_graph(size, hexboard.grid,
+                                               hexboard.current), min_time)
+
+
+def bench_djikstra(size, rng, min_time):
+    """Seconds per edge-to-edge djikstra.djikstra search."""
+    import djikstra
+    hexboard = hexgame.Hex(size)
+    graph = djikstra.make_graph(size, hexboard.grid, hexgame.BLUE)
+    return measure(lambda: djikstra.djikstra(
+        graph, "0#0", "{}#{}".format(size - 1, size - 1)), min_time)
+
+
+def bench_find_best(size, rng, min_time):
+    """Seconds per move chosen by djikstra.find_best."""
+    import djikstra
+    hexboard = random_position(size, rng)
+
+    def choose():
+        graph = djikstra.make_graph(size, hexboard.grid, hexboard.current)
+        djikstra.find_best(size, hexboard.grid, graph, hexboard.current)
+    return measure(choose, min_time)
+
+
+def free_port():
+    """Returns a TCP port which is free (for now)."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def connect(port, timeout=10):
+    """Connects to the server, waiting for it to start."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return socket.create_connection(('127.0.0.1', port))
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.01)
+
+
+def minimal_client(sock, rng, counts):
+    """Plays random moves as fast as possible, counts the messages."""
+    with sock, sock.makefile('rwb') as stream:
+        for line in stream:
+            counts.append(1)
+            message = line.decode().split()
+            if message[0] == 'Play':
+                grid = message[1].split('/')[1]
+                empty = [index for index, cell in
+                         enumerate(grid.replace('#', '-').split('-'))
+                         if cell == str(hexgame.EMPTY)]
+                size = grid.count('#') + 1
+                stream.write("{}#{} {}\n".format(
+                    *divmod(rng.choice(empty), size), message[2]).encode())
+                stream.flush()
+
+
+def bench_server(size, rng, min_time):
+    """Messages per second of a server session (Play, Ack, ...)."""
+    port = free_port()
+    command = [sys.executable, SERVER_PATH, str(size), '--port', str(port),
+               '--games', str(SERVER_GAMES)]
+    with Popen(command, stdout=DEVNULL, stderr=DEVNULL) as server:
+        try:
+            counts = []
+            # The server start-up is not measured
+            sockets = [connect(port), connect(port)]
+            start = time.perf_counter()
+            clients = [threading.Thread(target=minimal_client,
+                                        args=(sock, rng, counts),
+                                        daemon=True)
+                       for sock in sockets]
+            for client in clients:
+                client.start()
+            server.wait(SERVER_TIMEOUT)
+            for client in clients:
+                client.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            # A failed session must not leave the server running
+            if server.poll() is None:
+                server.kill()
+    return len(counts) / elapsed
+
+
+def bench_redraw(size, rng, min_time):
+    """Seconds per hexgui.redraw of a new move, off-screen."""
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import hexgui
+    if hexgui.pygame is None:
+        raise ImportError('pygame is not installed')
+    if hexgui.screen is None:
+        hexgui.pygame.init()
+        hexgui.screen = hexgui.pygame.display.set_mode(hexgui.SIZE)
+    moves = random_game(size, rng)
+    boards = [hexgame.Hex(size)]
+    for i, j in moves:
+        boards.append(hexgame.Hex.create_from_str(boards[-1].serialize()))
+        boards[-1].play(i, j)
+
+    def redraw_game():
+        hexgui.frame_grid = None
+        for hexboard in boards:
+            hexgui.redraw(hexboard)
+    return measure(redraw_game, min_time) / len(boards)
+
+
+# name -> (function, unit, True if higher values are better)
+BENCHMARKS = {
+    'play': (bench_play, 's/move', False),
+    'serialize': (bench_serialize, 's/call', False),
+    'create_graph': (bench_create_graph, 's/call', False),
+    'make_graph': (bench_make_graph, 's/call', False),
+    'djikstra': (bench_djikstra, 's/call', False),
+    'find_best': (bench_find_best, 's/move', False),
+    'server': (bench_server, 'messages/s', True),
+    'redraw': (bench_redraw, 's/frame', False),
+}
+
+
+def run(names, sizes, min_time, seed):
+    """Runs the benchmarks, returns the list of their results."""
+    results = []
+    for name in names:
+        function, unit, higher_is_better = BENCHMARKS[name]
+        for size in sizes:
+            result = {'name': name, 'size': size, 'unit': unit,
+                      'higher_is_better': higher_is_better}
+            try:
+                result['value'] = function(size, random.Random(seed),
+                                           min_time)
+            except ImportError as error:
+                result['skipped'] = str(error)
+            except Exception as error:
+                # A broken benchmark must not stop the others
+                result['failed'] = "{}: {}".format(type(error).__name__,
+                                                   error)
+            print_result(result)
+            results.append(result)
+    return results
+
+
+def print_result(result, baseline=None):
+    """Prints a result, and its change relative to the baseline."""
+    line = "{:<14}{:>4} ".format(result['name'], result['size'])
+    if 'skipped' in result:
+        line += "skipped ({})".format(result['skipped'])
+    elif 'failed' in result:
+        line += "FAILED ({})".format(result['failed'])
+    else:
+        line += "{:>12.4g} {:<11}".format(result['value'], result['unit'])
+        if baseline is not None:
+            line += "{:+7.1%}".format(result['value'] / baseline - 1)
+    print(line)
+    sys.stdout.flush()
+
+
+def compare(results, baseline_results, threshold):
+    """
+    Compares the results to the baseline ones, prints the changes and
+    returns the regressions.
+    """
+    baseline = {(result['name'], result['size']): result['value']
+                for result in baseline_results if 'value' in result}
+    regressions = []
+    print('-' * 60)
+    for result in results:
+        reference = baseline.get((result['name'], result['size']))
+        if 'value' not in result or not reference:
+            continue
+        print_result(result, reference)
+        # Slow down: more time per operation, or fewer messages per second
+        slow_down = (reference / result['value'] - 1
+                     if result['higher_is_better']
+                     else result['value'] / reference - 1)
+        if slow_down > threshold:
+            regressions.append(result)
+    for result in regressions:
+        print("Regression: {} on size {}".format(result['name'],
+                                                  result['size']))
+    return regressions
+
+
+def main():
+    """Runs the benchmarks."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('benchmarks', nargs='*',
+                        help='benchmarks to run, among {} (all by default)'
+                        .format(', '.join(BENCHMARKS)))
+    parser.add_argument('--sizes', nargs='+', default=SIZES, type=int)
+    parser.add_argument('--min-time', default=MIN_TIME, type=float,
+                        help='seconds spent at least on each measure')
+    parser.add_argument('--seed', default=0, type=int)
+    parser.add_argument('--output', default=None,
+                        help='JSON file where the results are written')
+    parser.add_argument('--baseline', default=None,
+                        help='JSON file of results to compare with')
+    parser.add_argument('--threshold', default=THRESHOLD, type=float,
+                        help='relative slow down reported as a regression')
+    arguments = parser.parse_args(sys.argv[1:])
+    unknown = set(arguments.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error('unknown benchmarks: {}'.format(', '.join(unknown)))
+
+    results = run(arguments.benchmarks or list(BENCHMARKS), arguments.sizes,
+                  arguments.min_time, arguments.seed)
+    if arguments.output:
+        with open(arguments.output, 'w') as output:
+            json.dump({'python': platform.python_version(),
+                       'machine': platform.machine(),
+                       'time': time.time(),
+                       'results': results}, output, indent=1)
+    if arguments.baseline:
+        with open(arguments.baseline) as baseline:
+            baseline_results = json.load(baseline)['results']
+        if compare(results, baseline_results, arguments.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/python3
+
+"""
+This module implements a client for the Hex board game playing on the
+shortest connections of both players, as measured by the distance
+engine of distances.py.
+"""
+
+import distances
+import hexclient
+import hexgame
+
+
+class DistancePlayer(hexclient.Player):
+    """
+    A player choosing the empty cell on the shortest connections of
+    both players, with distance maps kept from move to move.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.engine = None
+
+    def on_start(self, hexboard, color):
+        super().on_start(hexboard, color)
+        self.engine = distances.DistanceEngine(hexboard.size)
+
+    def choose_move(self, hexboard, time_budget):
+        if self.engine is None or self.engine.size != hexboard.size:
+            self.engine = distances.DistanceEngine(hexboard.size)
+        self.engine.sync(hexboard)
+        size = hexboard.size
+        adversary = (hexgame.RED if hexboard.current == hexgame.BLUE
+                     else hexgame.BLUE)
+        # A player cut off counts as far, not as infinitely far
+        cap = size * size
+
+        def score(cell):
+            own = min(self.engine.through(hexboard.current, *cell), cap)
+            other = min(self.engine.through(adversary, *cell), cap)
+            return own + other, own
+
+        return min(((i, j) for i in range(size) for j in range(size)
+                    if hexboard.grid[i][j] == hexgame.EMPTY), key=score)
+
+
+def main():
+    """Runs the client."""
+    hexclient.main(DistancePlayer())
+
+
+if __name__ == '__main__':
+    main()
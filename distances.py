@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+
+"""
+This module implements a distance engine maintained incrementally
+from move to move (the player using it is in distance_client.py).
+
+For each player, the engine keeps two distance maps: the number of
+empty cells on the shortest path from each of the player's edges to
+every cell (the player's stones cost nothing, the adversary's stones
+cannot be crossed). A new stone changes the cost of a single cell, so
+the maps are repaired around it instead of being recomputed:
+
+- for the player of the stone, the cost of the cell decreases: the
+  new distances are propagated from the cell, Dijkstra-style, as long
+  as they improve;
+- for the adversary, the cell becomes blocked: the cells whose
+  shortest paths may go through it (its successors along tight edges)
+  are invalidated, and their distances are recomputed from the valid
+  cells around them.
+
+Removing a stone (to take a move back, e.g. in a search) is repaired
+the same way, the other way round: the cost of the cell increases for
+the player of the stone, and decreases for the adversary.
+
+The cost of a move thus depends on the region it changes, not on the
+size of the board. The number of repaired cells is counted when
+profiling is enabled (see hexprofile.py).
+"""
+
+
+import heapq
+
+import hexgame
+import hexprofile
+
+
+INF = float('inf')
+
+
+class DistanceEngine():
+    """
+    The DistanceEngine class maintains the edge distance maps of both
+    players on a board of a given size.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.neighbours = [
+            [k * size + l
+             for k, l in ((i - 1, j), (i - 1, j + 1), (i, j + 1),
+                          (i + 1, j), (i + 1, j - 1), (i, j - 1))
+             if 0 <= k < size and 0 <= l < size]
+            for i in range(size) for j in range(size)]
+        # Blue connects the left and right edges, Red the top and bottom
+        self.edges = {
+            hexgame.BLUE: ({i * size for i in range(size)},
+                           {i * size + size - 1 for i in range(size)}),
+            hexgame.RED: (set(range(size)),
+                          {(size - 1) * size + j for j in range(size)})}
+        [self.grid, self.costs, self.maps] = [None] * 3
+        self.reset()
+
+    def reset(self, hexboard=None):
+        """
+        Empties the board, or sets it to the stones of the given board,
+        and computes the distance maps from scratch.
+        """
+        size = self.size
+        self.grid = ([hexboard.grid[i][j] for i in range(size)
+                      for j in range(size)] if hexboard
+                     else [hexgame.EMPTY] * (size * size))
+        self.costs = {player: [0 if color == player
+                               else 1 if color == hexgame.EMPTY else INF
+                               for color in self.grid]
+                      for player in (hexgame.BLUE, hexgame.RED)}
+        self.maps = {player: [self._compute(player, edge)
+                              for edge in self.edges[player]]
+                     for player in (hexgame.BLUE, hexgame.RED)}
+
+    def _compute(self, player, edge):
+        """Returns the distance map from an edge, computed from scratch."""
+        costs = self.costs[player]
+        distances = [INF] * len(costs)
+        heap = []
+        for cell in edge:
+            distances[cell] = costs[cell]
+            heap.append((costs[cell], cell))
+        heapq.heapify(heap)
+        self._propagate(distances, costs, heap)
+        return distances
+
+    def _propagate(self, distances, costs, heap):
+        """
+        Relaxes the distances from the cells of the heap, until no
+        distance improves. Returns the number of cells settled.
+        """
+        neighbours = self.neighbours
+        settled = 0
+        while heap:
+            distance, cell = heapq.heappop(heap)
+            if distance > distances[cell]:
+                continue
+            settled += 1
+            for neighbour in neighbours[cell]:
+                new_distance = distance + costs[neighbour]
+                if new_distance < distances[neighbour]:
+                    distances[neighbour] = new_distance
+                    heapq.heappush(heap, (new_distance, neighbour))
+        return settled
+
+    def _decrease(self, distances, costs, cell, edge):
+        """Repairs a distance map after the cost of a cell decreased."""
+        distance = costs[cell] + min(
+            [0 if cell in edge else INF]
+            + [distances[neighbour] for neighbour in self.neighbours[cell]])
+        if distance >= distances[cell]:
+            return 0
+        distances[cell] = distance
+        return self._propagate(distances, costs, [(distance, cell)])
+
+    def _increase(self, distances, costs, cell, edge):
+        """
+        Repairs a distance map after the cost of a cell increased, e.g.
+        when it is blocked (its cost is already the new one, its
+        distance is still the previous one).
+        """
+        neighbours = self.neighbours
+        # The cells whose shortest paths may go through the blocked cell
+        invalid, stack = {cell}, [cell]
+        while stack:
+            current = stack.pop()
+            for neighbour in neighbours[current]:
+                if (neighbour not in invalid
+                        and distances[neighbour] < INF
+                        and distances[neighbour]
+                        == distances[current] + costs[neighbour]):
+                    invalid.add(neighbour)
+                    stack.append(neighbour)
+        for invalid_cell in invalid:
+            distances[invalid_cell] = INF
+        # The other distances are still exact: restart from them
+        heap = []
+        for invalid_cell in invalid:
+            cost = costs[invalid_cell]
+            if cost == INF:
+                continue
+            distance = min([0 if invalid_cell in edge else INF]
+                           + [distances[neighbour]
+                              for neighbour in neighbours[invalid_cell]
+                              if neighbour not in invalid]) + cost
+            if distance < INF:
+                distances[invalid_cell] = distance
+                heap.append((distance, invalid_cell))
+        heapq.heapify(heap)
+        return len(invalid) + self._propagate(distances, costs, heap)
+
+    def place(self, i, j, color):
+        """Adds a stone to the board, and repairs the distance maps."""
+        cell = i * self.size + j
+        self.grid[cell] = color
+        repaired = 0
+        for player in (hexgame.BLUE, hexgame.RED):
+            costs = self.costs[player]
+            if player == color:
+                costs[cell] = 0
+                repair = self._decrease
+            else:
+                costs[cell] = INF
+                repair = self._increase
+            for distances, edge in zip(self.maps[player],
+                                       self.edges[player]):
+                repaired += repair(distances, costs, cell, edge)
+        if hexprofile.enabled:
+            hexprofile.count('cells_repaired', repaired)
+
+    def remove(self, i, j):
+        """Removes a stone from the board, and repairs the distance maps."""
+        cell = i * self.size + j
+        color = self.grid[cell]
+        self.grid[cell] = hexgame.EMPTY
+        repaired = 0
+        for player in (hexgame.BLUE, hexgame.RED):
+            costs = self.costs[player]
+            costs[cell] = 1
+            repair = self._increase if player == color else self._decrease
+            for distances, edge in zip(self.maps[player],
+                                       self.edges[player]):
+                repaired += repair(distances, costs, cell, edge)
+        if hexprofile.enabled:
+            hexprofile.count('cells_repaired', repaired)
+
+    def sync(self, hexboard):
+        """
+        Places the stones of a board which are not on the engine's
+        board yet. Starts over if stones were removed (e.g. a new game).
+        """
+        size = self.size
+        new_stones = []
+        for cell, color in enumerate(self.grid):
+            stone = hexboard.grid[cell // size][cell % size]
+            if stone != color:
+                if color != hexgame.EMPTY:
+                    self.reset(hexboard)
+                    return
+                new_stones.append((cell // size, cell % size, stone))
+        for i, j, stone in new_stones:
+            self.place(i, j, stone)
+
+    def distance(self, player):
+        """
+        Returns the number of empty cells a player still has to fill
+        to connect its edges (0 once connected, INF if cut off).
+        """
+        first, _ = self.maps[player]
+        return min(first[cell] for cell in self.edges[player][1])
+
+    def through(self, player, i, j):
+        """
+        Returns the distance of the best connection of a player going
+        through a cell (INF if the cell is the adversary's).
+        """
+        cell = i * self.size + j
+        cost = self.costs[player][cell]
+        if cost == INF:
+            return INF
+        first, second = self.maps[player]
+        return first[cell] + second[cell] - cost
+
+
+hexprofile.register(DistanceEngine, 'distances.DistanceEngine',
+                    ['place', 'remove', 'sync'])
+
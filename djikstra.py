@@ -6,20 +6,14 @@ for the Hex board game.
 """
 
 
-import asyncio
-import sys
-import hexgui
-import hexgame
+import hexclient
+import hexprofile
 
 import random
 import math
+import sys
 from collections import defaultdict
 
-INIT_STATE, START, PLAYING, WAITING_FOR_ACK,\
-    WAITING_FOR_ADVERSARY_MOVE, END_STATE, CONNECTION_REFUSED = range(7)
-HOST = '127.0.0.1'
-PORT = 8888
-
 EMPTY=0
 
 class Graph():
@@ -34,81 +28,14 @@ class Graph():
         self.weights[(from_node, to_node)] = weight
         self.weights[(to_node, from_node)] = weight
 
-@asyncio.coroutine
-def send_message_callback(writer, row, col, state):
-    """A callback that sends the move to the server and waits for ack."""
-    writer.write("{}#{}\n".format(row, col).encode())
-    yield from writer.drain()
-    state[0] = WAITING_FOR_ACK
-
-
-@asyncio.coroutine
-def game_client(loop, state):
-    """The main client
-                hexboard.current=2 logic, based on a state machine."""
-    reader, writer = yield from asyncio.open_connection(HOST, PORT,
-                                                        loop=loop)
-    print("Connected to the game server")
-    sys.stdout.flush()
-    state[0] = INIT_STATE
-    player=2
-    init=0
-    while state[0] not in (END_STATE, CONNECTION_REFUSED):
-        if state[0] == INIT_STATE:
-            data = yield from reader.readline()
-            message = data.decode()
-            if message.startswith("Start"):
-                print(message)
-                hexboard = hexgame.Hex.create_from_str(message[6:])
-                hexgui.init_screen()
-                hexgui.redraw(hexboard)
-                state[0] = START
-            if message.startswith("TooManyPlayers"):
-                print(message)
-                state[0] = CONNECTION_REFUSED
-        if state[0] in [START, WAITING_FOR_ADVERSARY_MOVE]:
-            data = yield from reader.readline()
-            message = data.decode()
-            if message.startswith("Play"):
-                state[0] = PLAYING
-                hexboard = hexgame.Hex.create_from_str(message[5:])
-                hexgui.redraw(hexboard)
-                hexgui.set_title("Hex game - your turn")
-                if init==0 and "1" not in message:
-                    player=1
-                    init=1
-                print(message)
-            if message.startswith("End"):
-                state[0] = END_STATE
-                hexgui.set_title("Hex game - end of game")
-                hexboard = hexgame.Hex.create_from_str(message[4:])
-                hexgui.redraw(hexboard)
-                print(message)
-        if state[0] == PLAYING:
-            row, col = None, None
-            graph = make_graph(hexboard.size, hexboard.grid, player)
-            tab = find_best(hexboard.size, hexboard.grid, graph, player)
-            row=tab[0]
-            col=tab[1]
-            yield from send_message_callback(writer,row, col,state)
-        if state[0] == WAITING_FOR_ACK:
-            data = yield from reader.readline()
-            message = data.decode()
-            if message.startswith("Ack"):
-                print(message)
-                hexboard = hexgame.Hex.create_from_str(message[4:])
-                hexgui.redraw(hexboard)
-                state[0] = WAITING_FOR_ADVERSARY_MOVE
-                hexgui.set_title("Hex game - waiting for adversary move")
-            if message.startswith("InvalidMove"):
-                print(message)
-                state[0] = PLAYING
-        sys.stdout.flush()
-
-    if state[0] == END_STATE:
-        print("Joueur :"+str(player))
-        print("{} wins the game".format(hexgui.player_names[hexboard.winner]))
-    writer.close()
+
+class DjikstraPlayer(hexclient.Player):
+    """A player following the shortest path between its two edges."""
+
+    def choose_move(self, hexboard, time_budget):
+        graph = make_graph(hexboard.size, hexboard.grid, self.color)
+        tab = find_best(hexboard.size, hexboard.grid, graph, self.color)
+        return tab[0], tab[1]
 
 
 def make_graph(size, grid, current):
@@ -270,9 +197,13 @@ def djikstra(graph, initial, end):
 
         next_destinations = {node: shortest_paths[node] for node in shortest_paths if node not in visited}
         if not next_destinations:
+            if hexprofile.enabled:
+                hexprofile.count('nodes_expanded', len(visited))
             return "Route Non Possible"
         current_node = min(next_destinations, key=lambda k: next_destinations[k][1])
 
+    if hexprofile.enabled:
+        hexprofile.count('nodes_expanded', len(visited))
     path = list()
     while current_node is not None:
         path.append(current_node)
@@ -304,10 +235,15 @@ def find_best(size, grid, graph, current):
     tab=random.choice(path).split("#")
     tab[0]=int(tab[0])
     tab[1]=int(tab[1])
+    rejected=0
     while grid[tab[0]][tab[1]]:
+        rejected+=1
         tab=random.choice(path).split("#")
         tab[0]=int(tab[0])
         tab[1]=int(tab[1])
+    if hexprofile.enabled:
+        hexprofile.count('paths_computed', len(lst))
+        hexprofile.count('occupied_cells_rejected', rejected)
     return tab
 
 def weigh(graph, elt):
@@ -319,16 +255,13 @@ def weigh(graph, elt):
     #print(sum)
     return sum
 
+hexprofile.register(sys.modules[__name__], 'djikstra',
+                    ['make_graph', 'djikstra', 'weigh', 'find_best'])
+
+
 def main():
     """Runs the graphical client."""
-    loop = asyncio.get_event_loop()
-    state = [None]
-    loop.run_until_complete(game_client(loop, state))
-    if state[0] != CONNECTION_REFUSED:
-        loop.run_until_complete(hexgui.handle_events(hex, None))
-        hexgui.teardown_screen()
-    loop.run_until_complete(loop.shutdown_asyncgens())
-    loop.close()
+    hexclient.main(DjikstraPlayer())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+
+"""
+This module implements a learned evaluation of Hex positions, based
+on local patterns: the colors of the 6 neighbours of a cell, where a
+neighbour off the board takes the color of the corresponding edge.
+
+- The move prior of an empty cell is a softmax over the weights of
+  the patterns of the empty cells.
+- The value (probability of winning for the player to move) is a
+  logistic regression over the counts of (cell color, pattern) pairs.
+
+Positions are always seen from the point of view of the player to
+move: when Red is to move, the board is transposed and its colors are
+swapped, which gives the equivalent position with Blue to move.
+
+Everything is computed by NumPy on whole batches of positions, and
+the weights are stored in a small .npz file, learned with `train`
+from self-play samples (see selfplay.py). The module does not depend
+on the game client: the player of the moves of highest prior is in
+prior_client.py.
+"""
+
+
+import argparse
+import sys
+
+import numpy as np
+
+import hexgame
+import selfplay
+
+
+# The neighbours of a cell, in the order of the pattern digits
+NEIGHBOURS = [(-1, 0), (-1, 1), (0, 1), (1, 0), (1, -1), (0, -1)]
+PATTERNS = 3 ** len(NEIGHBOURS)
+VALUE_FEATURES = 3 * PATTERNS
+DEFAULT_WEIGHTS = 'weights.npz'
+
+
+def blue_to_move(boards, to_move):
+    """
+    Returns the boards (shape (n, size, size)) seen by the players to
+    move: the boards where Red is to move are transposed, with their
+    colors swapped. Also returns the mask of these boards.
+    """
+    boards = np.asarray(boards, dtype=np.uint8)
+    red = np.asarray(to_move) == hexgame.RED
+    swapped = np.array([hexgame.EMPTY, hexgame.RED, hexgame.BLUE],
+                       dtype=np.uint8)[boards.transpose(0, 2, 1)]
+    return np.where(red[:, np.newaxis, np.newaxis], swapped, boards), red
+
+
+def pattern_codes(boards):
+    """
+    Returns the pattern code of every cell of Blue to move boards,
+    an integer array of shape (n, size, size).
+    """
+    count, size = boards.shape[0], boards.shape[1]
+    # Blue owns the left and right edges, Red the top and bottom ones
+    padded = np.empty((count, size + 2, size + 2), dtype=np.int32)
+    padded[:, 0, :] = padded[:, -1, :] = hexgame.RED
+    padded[:, :, 0] = padded[:, :, -1] = hexgame.BLUE
+    padded[:, 1:-1, 1:-1] = boards
+    codes = np.zeros((count, size, size), dtype=np.int32)
+    for digit, (d_i, d_j) in enumerate(NEIGHBOURS):
+        codes += 3 ** digit * padded[:, 1 + d_i:size + 1 + d_i,
+                                     1 + d_j:size + 1 + d_j]
+    return codes
+
+
+class Evaluator():
+    """
+    The Evaluator class scores batches of positions with learned
+    pattern weights.
+    """
+
+    def __init__(self, move_weights=None, value_weights=None, value_bias=0):
+        self.move_weights = (np.zeros(PATTERNS) if move_weights is None
+                             else np.asarray(move_weights, dtype=np.float64))
+        self.value_weights = (np.zeros(VALUE_FEATURES)
+                              if value_weights is None
+                              else np.asarray(value_weights,
+                                              dtype=np.float64))
+        self.value_bias = float(value_bias)
+
+    @staticmethod
+    def load(path=DEFAULT_WEIGHTS):
+        """Loads the weights saved by save."""
+        with np.load(path) as weights:
+            return Evaluator(weights['move'], weights['value'],
+                             weights['bias'])
+
+    def save(self, path=DEFAULT_WEIGHTS):
+        """Saves the weights in a compressed .npz file."""
+        np.savez_compressed(path, move=self.move_weights,
+                            value=self.value_weights, bias=self.value_bias)
+
+    @staticmethod
+    def _features(boards, to_move):
+        boards, red = blue_to_move(boards, to_move)
+        return boards, pattern_codes(boards), red
+
+    def _move_probabilities(self, boards, codes):
+        logits = np.where(boards == hexgame.EMPTY,
+                          self.move_weights[codes], -np.inf)
+        logits -= logits.max(axis=(1, 2), keepdims=True)
+        probabilities = np.exp(logits)
+        return probabilities / probabilities.sum(axis=(1, 2), keepdims=True)
+
+    def _value_counts(self, boards, codes):
+        count = boards.shape[0]
+        features = (boards.astype(np.int64) * PATTERNS + codes).reshape(
+            count, -1)
+        offsets = np.arange(count)[:, np.newaxis] * VALUE_FEATURES
+        return np.bincount((features + offsets).ravel(),
+                           minlength=count * VALUE_FEATURES).reshape(
+                               count, VALUE_FEATURES)
+
+    def move_priors(self, boards, to_move):
+        """
+        Returns the prior of each move, shape (n, size, size), 0 for
+        the occupied cells.
+
+        Arguments:
+        - The boards, shape (n, size, size).
+        - The player to move on each board, shape (n,).
+        """
+        return self._priors(*self._features(boards, to_move))
+
+    def values(self, boards, to_move):
+        """
+        Returns the probability of winning of the players to move,
+        shape (n,).
+        """
+        return self._values(*self._features(boards, to_move))
+
+    def evaluate(self, boards, to_move):
+        """Returns both the move priors and the values of the boards."""
+        features = self._features(boards, to_move)
+        return self._priors(*features), self._values(*features)
+
+    def _priors(self, boards, codes, red):
+        priors = self._move_probabilities(boards, codes)
+        return np.where(red[:, np.newaxis, np.newaxis],
+                        priors.transpose(0, 2, 1), priors)
+
+    def _values(self, boards, codes, red):
+        scores = (self._value_counts(boards, codes) @ self.value_weights
+                  + self.value_bias)
+        return 1 / (1 + np.exp(-scores))
+
+    def train_step(self, samples, learning_rate):
+        """
+        Does a gradient step on a batch of samples (as returned by
+        selfplay.ShardReader.sample). Returns the two losses.
+        """
+        boards, codes, red = self._features(samples['board'],
+                                            samples['to_move'])
+        count, size = boards.shape[0], boards.shape[1]
+
+        # Move prior: cross-entropy of the played moves
+        moves = samples['move'].astype(np.int64)
+        rows, cols = moves // size, moves % size
+        # The played moves are in the transposed board for Red
+        rows, cols = np.where(red, cols, rows), np.where(red, rows, cols)
+        probabilities = self._move_probabilities(boards, codes)
+        move_loss = -np.mean(np.log(
+            probabilities[np.arange(count), rows, cols] + 1e-12))
+        gradient = probabilities
+        gradient[np.arange(count), rows, cols] -= 1
+        move_gradient = np.bincount(codes.ravel(), weights=gradient.ravel(),
+                                    minlength=PATTERNS)
+        self.move_weights -= learning_rate * move_gradient / count
+
+        # Value: logistic loss of the final results
+        counts = self._value_counts(boards, codes)
+        won = (samples['winner'] == samples['to_move']).astype(np.float64)
+        predicted = 1 / (1 + np.exp(-(counts @ self.value_weights
+                                      + self.value_bias)))
+        value_loss = -np.mean(won * np.log(predicted + 1e-12)
+                              + (1 - won) * np.log(1 - predicted + 1e-12))
+        error = predicted - won
+        # Counts grow with the board area, so is the step size scaled
+        self.value_weights -= (learning_rate * counts.T @ error
+                               / (count * size * size))
+        self.value_bias -= learning_rate * error.mean()
+        return move_loss, value_loss
+
+
+def train(data, size, steps, batch, learning_rate, weights):
+    """Trains the evaluator on self-play samples, saves its weights."""
+    reader = selfplay.ShardReader(data, size)
+    rng = np.random.default_rng()
+    evaluator = Evaluator()
+    for step in range(1, steps + 1):
+        move_loss, value_loss = evaluator.train_step(
+            reader.sample(batch, rng), learning_rate)
+        if step % 10 == 0 or step == steps:
+            print("Step {}: move loss {:.4f}, value loss {:.4f}".format(
+                step, move_loss, value_loss))
+            sys.stdout.flush()
+    evaluator.save(weights)
+
+
+def main():
+    """Trains the evaluator on self-play data."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('data', help='self-play data directory')
+    parser.add_argument('--size', default=11, type=int)
+    parser.add_argument('--steps', default=200, type=int)
+    parser.add_argument('--batch', default=1024, type=int)
+    parser.add_argument('--learning-rate', default=1.0, type=float)
+    parser.add_argument('--weights', default=DEFAULT_WEIGHTS)
+    arguments = parser.parse_args(sys.argv[1:])
+    train(arguments.data, arguments.size, arguments.steps, arguments.batch,
+          arguments.learning_rate, arguments.weights)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+#!/usr/bin/python3
+
+"""
+This module implements the client side of the Hex game protocol,
+shared by all the clients. A client only provides a player object,
+whose hooks are called by the state machine below:
+
+- on_start(hexboard, color): a new game starts, the color of the
+  player is known (called before its first move);
+- on_opponent_move(hexboard): the adversary has just played;
+- choose_move(hexboard, time_budget): returns the (row, col) move
+  to play. Unless it is a coroutine, it runs in an executor so that
+  long searches do not block the event loop;
+- ponder(hexboard, stop_event): runs in the executor while the
+  adversary is thinking, and must return once stop_event is set;
+- on_end(hexboard): the game is over.
+
+The moves chosen in the executor can be profiled with --profile (see
+hexprofile.py).
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import sys
+import threading
+
+import hexdisplay
+import hexgame
+import hexprofile
+
+
+INIT_STATE, START, PLAYING, WAITING_FOR_ACK,\
+    WAITING_FOR_ADVERSARY_MOVE, END_STATE, CONNECTION_REFUSED = range(7)
+HOST = '127.0.0.1'
+PORT = 8888
+TIME_SAFETY = 0.8  # Part of the time share actually used for a move
+
+
+class Player():
+    """
+    The Player class is the base class of the game engines.
+    Engines must override choose_move, the other hooks are optional.
+    """
+
+    def __init__(self):
+        self.color = None
+
+    def on_start(self, hexboard, color):
+        """
+        Called when a new game starts.
+
+        Arguments:
+        - The current board.
+        - The color of the player (hexgame.BLUE or hexgame.RED).
+        """
+        self.color = color
+
+    def on_opponent_move(self, hexboard):
+        """Called with the new board when the adversary has played."""
+        pass
+
+    def choose_move(self, hexboard, time_budget):
+        """
+        Returns the move to play, as a (row, column) pair.
+
+        Arguments:
+        - The current board.
+        - The time (in seconds) the player may use, or None if the
+          game is not timed.
+        """
+        raise NotImplementedError
+
+    def ponder(self, hexboard, stop_event):
+        """
+        Called while the adversary is thinking. Implementations must
+        return as soon as possible once stop_event is set.
+        """
+        pass
+
+    def on_end(self, hexboard):
+        """Called with the final board when the game is over."""
+        pass
+
+
+def time_budget(hexboard, remaining):
+    """
+    Returns the time the player may use for its next move, given the
+    time remaining on its clock (None if the game is not timed).
+    """
+    if remaining is None:
+        return None
+    empty = sum(row.count(hexgame.EMPTY) for row in hexboard.grid)
+    # Each player fills about half of the empty cells, keep a margin
+    return TIME_SAFETY * remaining / (empty // 2 + 1)
+
+
+@asyncio.coroutine
+def choose_move(loop, executor, player, hexboard, time_budget):
+    """Asks the player for a move, in the executor if needed."""
+    if asyncio.iscoroutinefunction(player.choose_move):
+        move = yield from player.choose_move(hexboard, time_budget)
+    else:
+        move = yield from loop.run_in_executor(
+            executor, hexprofile.profiled_move(player.choose_move),
+            hexboard, time_budget)
+    return move
+
+
+@asyncio.coroutine
+def game_client(loop, state, player, display, host=HOST, port=PORT):
+    """The main client logic, based on a state machine."""
+    reader, writer = yield from asyncio.open_connection(host, port,
+                                                        loop=loop)
+    print("Connected to the game server")
+    sys.stdout.flush()
+    # A single worker, so that pondering and searching never overlap
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    state[0] = INIT_STATE
+    games_left = 1
+    hexboard, last_board = None, None
+    pondering, stop_pondering = None, None
+    while state[0] not in (END_STATE, CONNECTION_REFUSED):
+        data = yield from reader.readline()
+        if not data:
+            print("Connection closed by the server")
+            state[0] = END_STATE
+            break
+        message = data.decode()
+        print(message)
+        if pondering:
+            stop_pondering.set()
+            yield from pondering
+            pondering = None
+        if message.startswith("Session"):
+            # The server plays several games on this connection
+            games_left = int(message[8:])
+        if message.startswith("TooManyPlayers"):
+            state[0] = CONNECTION_REFUSED
+        if message.startswith("Start"):
+            hexboard = hexgame.Hex.create_from_str(message[6:])
+            last_board = message[6:].rstrip()
+            display.init_screen()
+            display.redraw(hexboard)
+            player.color = None
+            state[0] = START
+        if message.startswith("Play"):
+            state[0] = PLAYING
+            # The board, the identifier of the message, and the
+            # remaining time of timed games
+            fields = message[5:].split()
+            remaining = float(fields[2]) if len(fields) > 2 else None
+            hexboard = hexgame.Hex.create_from_str(fields[0])
+            display.redraw(hexboard)
+            display.set_title("Hex game - your turn")
+            if player.color is None:
+                player.on_start(hexboard, hexboard.current)
+            # Play is sent again after an invalid move: nothing changed
+            if fields[0] != last_board:
+                player.on_opponent_move(hexboard)
+            row, col = yield from choose_move(
+                loop, executor, player, hexboard,
+                time_budget(hexboard, remaining))
+            # The identifier tells the server which Play is answered
+            play_id = fields[1] if len(fields) > 1 else ""
+            writer.write("{}#{} {}\n".format(row, col, play_id).encode())
+            yield from writer.drain()
+            state[0] = WAITING_FOR_ACK
+        if message.startswith("InvalidMove"):
+            # The server asks for another move with a new Play message
+            state[0] = START
+        if message.startswith("Ack"):
+            hexboard = hexgame.Hex.create_from_str(message[4:])
+            last_board = message[4:].rstrip()
+            display.redraw(hexboard)
+            display.set_title("Hex game - waiting for adversary move")
+            state[0] = WAITING_FOR_ADVERSARY_MOVE
+            stop_pondering = threading.Event()
+            pondering = loop.run_in_executor(executor, player.ponder,
+                                             hexboard, stop_pondering)
+        if message.startswith("End"):
+            hexboard = hexgame.Hex.create_from_str(message[4:])
+            display.set_title("Hex game - end of game")
+            display.redraw(hexboard)
+            player.on_end(hexboard)
+            print("{} wins the game".format(
+                hexgame.PLAYER_NAMES[hexboard.winner]))
+            games_left -= 1
+            state[0] = INIT_STATE if games_left > 0 else END_STATE
+        sys.stdout.flush()
+
+    writer.close()
+    executor.shutdown(wait=False)
+
+
+def main(player, headless=None):
+    """
+    Parses the command line, then connects the given player to the
+    game server and plays until the end of the game (or session).
+
+    Arguments:
+    - The player (an instance of a Player subclass).
+    - headless: forces the display mode. If None, it is chosen on
+      the command line (--headless / --display).
+    """
+    parser = argparse.ArgumentParser()
+    if headless is None:
+        parser.add_argument('--headless', action='store_true',
+                            default=hexdisplay.default_headless())
+        parser.add_argument('--display', dest='headless',
+                            action='store_false')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', default=PORT, type=int)
+    parser.add_argument('--profile', action='store_true',
+                        help='write a profile summary of each move')
+    parser.add_argument('--profile-output', default=None,
+                        help='file of the profile summaries (stderr)')
+    parser.add_argument('--profile-threshold', default=None, type=float,
+                        help='dump the cProfile statistics of the moves '
+                        'lasting longer, in seconds')
+    arguments = parser.parse_args(sys.argv[1:])
+    if (arguments.profile or arguments.profile_output
+            or arguments.profile_threshold is not None):
+        hexprofile.enable(arguments.profile_output,
+                          arguments.profile_threshold)
+    if headless is None:
+        headless = arguments.headless
+    display = hexdisplay.create_display(headless)
+    loop = asyncio.get_event_loop()
+    state = [None]
+    loop.run_until_complete(game_client(loop, state, player, display,
+                                        arguments.host, arguments.port))
+    if state[0] != CONNECTION_REFUSED:
+        display.run_until_closed(loop)
+    loop.run_until_complete(loop.shutdown_asyncgens())
+    loop.close()
@@ -0,0 +1,87 @@
+#!/usr/bin/python3
+
+"""
+This module provides the displays used by the game clients.
+
+The graphical interface (and therefore pygame, cairo and PIL) is
+only imported when a graphical display is actually requested, so
+that bots can run headless, e.g. in batches or on servers without
+any screen.
+"""
+
+import os
+import sys
+
+
+class HeadlessDisplay():
+    """A display that draws nothing, used when nobody is watching."""
+
+    def init_screen(self):
+        """Nothing to initialize."""
+        pass
+
+    def redraw(self, hexboard):
+        """Nothing to draw."""
+        pass
+
+    def set_title(self, title):
+        """No window, no title."""
+        pass
+
+    def run_until_closed(self, loop):
+        """There is no window to wait for."""
+        pass
+
+
+class GraphicalDisplay():
+    """A display based on the hexgui module, imported lazily."""
+
+    def __init__(self):
+        import hexgui
+        self.hexgui = hexgui
+        self.screen_ready = False
+
+    def init_screen(self):
+        """Opens the game window, unless it is already opened."""
+        if not self.screen_ready:
+            self.hexgui.init_screen()
+            self.screen_ready = True
+
+    def redraw(self, hexboard):
+        """Posts the given board to the render worker of the window."""
+        self.hexgui.post_redraw(hexboard)
+
+    def set_title(self, title):
+        """Changes the title of the game window."""
+        self.hexgui.set_title(title)
+
+    def run_until_closed(self, loop):
+        """Keeps the window alive until the user closes it."""
+        loop.run_until_complete(self.hexgui.handle_events(None, None))
+        self.hexgui.teardown_screen()
+
+
+def default_headless():
+    """
+    Returns True when no display is available, i.e. when the
+    HEX_HEADLESS environment variable is set or when there
+    is no X11/Wayland display on a Linux machine.
+    """
+    if os.environ.get('HEX_HEADLESS'):
+        return True
+    if sys.platform.startswith('linux'):
+        return not (os.environ.get('DISPLAY')
+                    or os.environ.get('WAYLAND_DISPLAY'))
+    return False
+
+
+def create_display(headless):
+    """
+    Creates the display used by a client.
+
+    Arguments:
+    - headless: if True, the graphical interface is never imported.
+    """
+    if headless:
+        return HeadlessDisplay()
+    return GraphicalDisplay()
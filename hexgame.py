@@ -8,7 +8,17 @@ Author: Sylvain B.
 Version: 1.0
 """
 
+import itertools
+
 EMPTY, BLUE, RED = 0, 1, 2
+PLAYER_NAMES = {
+    BLUE: "Blue player",
+    RED: "Orange player"
+}
+
+# The symmetries of Hex positions, see Hex.canonical_key
+IDENTITY, ROTATION, SWAP, SWAP_ROTATION = range(4)
+SWAP_COLORS = bytes.maketrans(bytes([BLUE, RED]), bytes([RED, BLUE]))
 
 
 class InvalidMoveException(Exception):
@@ -42,6 +52,9 @@ class Hex():
         hexboard = Hex(len(grid))
         hexboard.grid = grid
         hexboard.winner = None if winner_str == "" else int(winner_str)
+        # Blue always starts, so the stone counts tell who is to play
+        stones = sum(1 for row in grid for x in row if x != EMPTY)
+        hexboard.current = BLUE if stones % 2 == 0 else RED
         return hexboard
 
     def _2d_2_1d(self, i, j):
@@ -141,6 +154,46 @@ class Hex():
                             return True
         return False
 
+    def canonical_key(self):
+        """
+        Returns a key identifying the position up to its symmetries,
+        for caches and opening books, and the symmetry mapping the
+        position to the canonical one.
+
+        A position is equivalent to its 180° rotation (ROTATION), and
+        to its transpose with the colors and the player to move
+        swapped (SWAP), or to both (SWAP_ROTATION). The key is the
+        smallest of the four bytes strings made of the player to move
+        and of the cells, so that the canonical position always has
+        Blue to move.
+        """
+        size = self.size
+        cells = bytes(itertools.chain.from_iterable(self.grid))
+        swapped = b"".join(cells[j::size]
+                           for j in range(size)).translate(SWAP_COLORS)
+        other = BLUE if self.current == RED else RED
+        keys = [bytes([self.current]) + cells,
+                bytes([self.current]) + cells[::-1],
+                bytes([other]) + swapped,
+                bytes([other]) + swapped[::-1]]
+        key = min(keys)
+        return key, keys.index(key)
+
+    def transform_move(self, transform, i, j):
+        """
+        Applies a symmetry returned by canonical_key to a move. The
+        symmetries are their own inverses: the same call maps the
+        moves of the canonical position back to this position.
+        """
+        last = self.size - 1
+        if transform == ROTATION:
+            return last - i, last - j
+        if transform == SWAP:
+            return j, i
+        if transform == SWAP_ROTATION:
+            return last - j, last - i
+        return i, j
+
     def serialize(self):
         """Returns a string representing the board"""
         return "{}/{}".format(
@@ -4,12 +4,39 @@
 This module implements an Hex game server, which is based
 on the hexgame.py game engine, and communicates with clients
 using sockets.
+
+Each Play message carries an identifier, which the player sends back
+with its move ("<row>#<col> <id>"), so that a move arriving too late
+(e.g. after a timeout) is not taken as the answer to a later Play
+message. Moves without identifier are accepted as they are.
+
+Games can be timed with chess-clock style time controls: each
+player has a time bank (--time) for the whole game, possibly
+increased after each move (--increment). The remaining time is
+sent with each Play message, after its identifier, and a player
+whose time runs out loses the game.
+
+The server measures its hot paths (move validation, serialization,
+drains and client response times). The measures are served as plain
+text on --metrics-port and/or summarized every --stats-interval
+seconds on the standard output.
+
+Spectators connect to --spectator-port and send "Watch" (all the
+games) or "Watch <game number>", other requests are answered by
+"InvalidWatch". They then receive a "Board <game> <board>" line after
+each move and an "End <game> <board>" line at the end of each game.
+Slow spectators miss intermediate boards rather than slowing the game
+down.
 """
 
 
+import argparse
 import asyncio
+import bisect
+import json
 import random
 import sys
+import time
 import hexgame
 
 DEFAULT_HEXSIZE = 11
@@ -18,8 +45,248 @@ PORT = 8888
 TIMEOUT = None  # Change this if you want to add a timeout to each move
 
 
+class Histogram():
+    """
+    The Histogram class counts durations (in seconds) into buckets
+    of exponentially increasing size, from 1µs to about a minute.
+    """
+
+    BOUNDS = [1e-6 * 2 ** k for k in range(27)]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        """Adds a duration to the histogram."""
+        self.counts[bisect.bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, fraction):
+        """Returns an upper bound of the given quantile (e.g. 0.5)."""
+        threshold, seen = fraction * self.count, 0
+        for bound, count in zip(self.BOUNDS, self.counts):
+            seen += count
+            if seen >= threshold and seen:
+                return bound
+        return float("+inf") if self.count else 0
+
+    def lines(self, name):
+        """Returns the histogram in the Prometheus text format."""
+        lines, seen = ["# TYPE {} histogram".format(name)], 0
+        for bound, count in zip(self.BOUNDS, self.counts):
+            seen += count
+            lines.append('{}_bucket{{le="{:g}"}} {}'.format(name, bound, seen))
+        lines.append('{}_bucket{{le="+Inf"}} {}'.format(name, self.count))
+        lines.append("{}_sum {}".format(name, self.sum))
+        lines.append("{}_count {}".format(name, self.count))
+        return lines
+
+
+class Metrics():
+    """The Metrics class gathers the measures of the server hot paths."""
+
+    HISTOGRAMS = ['validation', 'serialization', 'drain', 'response']
+
+    def __init__(self):
+        self.histograms = {name: Histogram() for name in self.HISTOGRAMS}
+        self.start_time = time.monotonic()
+        self.active_games = 0
+        self.games = 0
+        self.moves = 0
+        self.last_report = (self.start_time, 0)
+
+    def observe(self, name, value):
+        """Adds a duration to the given histogram."""
+        self.histograms[name].observe(value)
+
+    def moves_per_second(self):
+        """Returns the mean number of moves per second since start-up."""
+        return self.moves / max(time.monotonic() - self.start_time, 1e-9)
+
+    def text(self):
+        """Returns all the metrics in the Prometheus text format."""
+        lines = []
+        for name in self.HISTOGRAMS:
+            lines.extend(self.histograms[name].lines(
+                "hex_{}_seconds".format(name)))
+        lines.append("hex_active_games {}".format(self.active_games))
+        lines.append("hex_games_total {}".format(self.games))
+        lines.append("hex_moves_total {}".format(self.moves))
+        lines.append("hex_moves_per_second {:.3f}".format(
+            self.moves_per_second()))
+        return "\n".join(lines) + "\n"
+
+    def stats_line(self):
+        """
+        Returns a one line summary: moves per second since the previous
+        summary, and the median / 99th percentile of each histogram.
+        """
+        now = time.monotonic()
+        last_time, last_moves = self.last_report
+        self.last_report = now, self.moves
+        rate = (self.moves - last_moves) / max(now - last_time, 1e-9)
+        return "Stats games={} active={} moves={} moves/s={:.1f} {}".format(
+            self.games, self.active_games, self.moves, rate,
+            " ".join("{}={:.2g}/{:.2g}s".format(
+                name, self.histograms[name].quantile(0.5),
+                self.histograms[name].quantile(0.99))
+                     for name in self.HISTOGRAMS))
+
+
+metrics = Metrics()
+
+
+class Spectators():
+    """
+    The Spectators class fans the board updates out to the spectators.
+    Each frame is encoded once for all the spectators, which all have
+    a bounded queue: when a spectator is too slow, its oldest frames
+    are dropped, so that it never delays the players.
+    """
+
+    QUEUE_SIZE = 4
+    # The time given to the spectators to receive their last frames
+    FLUSH_TIMEOUT = 2
+
+    def __init__(self):
+        self.queues = {}
+        # The tasks streaming to the spectators, stopped at shutdown
+        self.tasks = set()
+
+    def subscribe(self, game=None):
+        """
+        Returns the queue of a new spectator.
+
+        Arguments:
+        - The number of the watched game, None to watch all the games.
+        """
+        queue = asyncio.Queue(self.QUEUE_SIZE)
+        self.queues[queue] = game
+        return queue
+
+    def unsubscribe(self, queue):
+        """Forgets a spectator."""
+        self.queues.pop(queue, None)
+
+    def publish(self, game, message):
+        """Sends a message about the given game to its spectators."""
+        if not self.queues:
+            return
+        frame = message.encode()
+        for queue, watched in self.queues.items():
+            if watched is None or watched == game:
+                if queue.full():
+                    queue.get_nowait()
+                    queue.task_done()
+                queue.put_nowait(frame)
+
+    @asyncio.coroutine
+    def close(self):
+        """
+        This coroutine sends their queued frames to the spectators, then
+        stops the spectator tasks. A spectator too slow to receive them
+        within FLUSH_TIMEOUT seconds is cut off.
+        """
+        @asyncio.coroutine
+        def flush():
+            # None tells each spectator to stop after its last frames
+            for queue in list(self.queues):
+                yield from queue.put(None)
+                yield from queue.join()
+
+        try:
+            yield from asyncio.wait_for(flush(), self.FLUSH_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+        tasks = list(self.tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            yield from asyncio.gather(*tasks, return_exceptions=True)
+
+
+spectators = Spectators()
+
+
 @asyncio.coroutine
-def waiting_for_players(reader, writer, readers, writers, hexsize):
+def handle_spectator(reader, writer):
+    """This coroutine streams the board updates to a spectator."""
+    task = asyncio.current_task()
+    spectators.tasks.add(task)
+    queue = None
+    try:
+        data = yield from reader.readline()
+        fields = data.decode().split()
+        if (not fields or fields[0] != "Watch" or len(fields) > 2
+                or len(fields) == 2 and fields[1] != "all"
+                and not fields[1].isdigit()):
+            writer.write("InvalidWatch\n".encode())
+            yield from writer.drain()
+            return
+        game = None
+        if len(fields) > 1 and fields[1] != "all":
+            game = int(fields[1])
+        queue = spectators.subscribe(game)
+        while not writer.transport.is_closing():
+            frame = yield from queue.get()
+            if frame is None:
+                queue.task_done()
+                break
+            writer.write(frame)
+            yield from writer.drain()
+            queue.task_done()
+    except ConnectionError:
+        pass
+    finally:
+        if queue:
+            spectators.unsubscribe(queue)
+        spectators.tasks.discard(task)
+        writer.close()
+
+
+@asyncio.coroutine
+def serve_metrics(reader, writer):
+    """This coroutine answers a metrics request, e.g. from curl."""
+    # The request is read up to the blank line ending its headers, so
+    # that the connection is not reset before the client reads
+    while True:
+        line = yield from reader.readline()
+        if not line.strip():
+            break
+    body = metrics.text().encode()
+    writer.write("HTTP/1.0 200 OK\r\n"
+                 "Content-Type: text/plain; version=0.0.4\r\n"
+                 "Content-Length: {}\r\n\r\n".format(len(body)).encode())
+    writer.write(body)
+    yield from writer.drain()
+    writer.close()
+
+
+@asyncio.coroutine
+def print_stats(interval):
+    """This coroutine prints a stats line every interval seconds."""
+    while True:
+        yield from asyncio.sleep(interval)
+        print(metrics.stats_line())
+        sys.stdout.flush()
+
+
+def other_player(player):
+    """Returns the adversary of the given player."""
+    return hexgame.RED if player == hexgame.BLUE else hexgame.BLUE
+
+
+def write_record(filename, record):
+    """Appends a game record, as a JSON line, to the given file."""
+    with open(filename, 'a') as record_file:
+        record_file.write(json.dumps(record) + "\n")
+
+
+@asyncio.coroutine
+def waiting_for_players(reader, writer, readers, writers, options):
     """This coroutine waits for entering connections from players."""
     addr = writer.get_extra_info('peername')
     if len(writers) >= 2:
@@ -32,60 +299,176 @@ def waiting_for_players(reader, writer, readers, writers, hexsize):
         readers.append(reader)
         print("New player connected with peername {}".format(addr))
         sys.stdout.flush()
+        if options.games > 1:
+            # Clients supporting sessions stay connected between games
+            writer.write("Session {}\n".format(options.games).encode())
+            yield from writer.drain()
         if len(writers) == 2:
-            yield from handle_game(readers, writers, hexsize)
+            yield from handle_session(readers, writers, options)
+
+
+@asyncio.coroutine
+def handle_session(readers, writers, options):
+    """
+    This coroutine plays a series of games between the two
+    connected players, re-using the same connections.
+    """
+    for game in range(1, options.games + 1):
+        yield from handle_game(readers, writers, options, game)
+        if any(reader.at_eof() for reader in readers):
+            print("A player left the session")
+            sys.stdout.flush()
+            break
+    for writer in writers:
+        writer.close()
+    asyncio.get_event_loop().stop()
+
+
+def serialize(hexboard):
+    """Serializes the board, measuring the time spent."""
+    start = time.perf_counter()
+    board = hexboard.serialize()
+    metrics.observe('serialization', time.perf_counter() - start)
+    return board
+
+
+@asyncio.coroutine
+def send(writer, message):
+    """This coroutine sends a message, measuring the drain latency."""
+    writer.write(message.encode())
+    start = time.perf_counter()
+    yield from writer.drain()
+    metrics.observe('drain', time.perf_counter() - start)
 
 
 @asyncio.coroutine
-def handle_game(readers, writers, hexsize):
+def read_move(reader, play_id, timeout):
+    """
+    This coroutine returns the answer to the Play message play_id
+    (empty if the player disconnected), skipping the late answers to
+    the previous ones. Raises asyncio.TimeoutError after timeout
+    seconds (None to wait forever).
+    """
+    loop = asyncio.get_event_loop()
+    deadline = None if timeout is None else loop.time() + timeout
+    while True:
+        data = yield from asyncio.wait_for(
+            reader.readline(),
+            None if deadline is None else max(0, deadline - loop.time()))
+        fields = data.decode().split()
+        if len(fields) < 2 or fields[1] == play_id:
+            return data
+        print("Late move {} ignored".format(fields[0]))
+
+
+@asyncio.coroutine
+def handle_game(readers, writers, options, game=1):
     """This coroutine implements the main game and communication logic."""
+    metrics.active_games += 1
+    try:
+        winner = yield from play_game(readers, writers, options, game)
+    finally:
+        metrics.active_games -= 1
+    metrics.games += 1
+    return winner
+
+
+@asyncio.coroutine
+def play_game(readers, writers, options, game):
+    """This coroutine plays one game between the two players."""
+    loop = asyncio.get_event_loop()
     # We randomize the first player to start
     random_bool = int(random.randrange(2))
     players = {hexgame.BLUE: random_bool, hexgame.RED: 1 - random_bool}
+    peernames = {player: str(writers[index].get_extra_info('peername'))
+                 for player, index in players.items()}
     print("Starting game: {} # player 1 / {} # player 2".format(
-        writers[random_bool].get_extra_info('peername'),
-        writers[1 - random_bool].get_extra_info('peername')))
+        peernames[hexgame.BLUE], peernames[hexgame.RED]))
     sys.stdout.flush()
-    hexboard = hexgame.Hex(hexsize)
+    hexboard = hexgame.Hex(options.hexsize)
+    clocks = {hexgame.BLUE: options.time, hexgame.RED: options.time}
+    moves, reason = [], "connection"
+    board = serialize(hexboard)
+    spectators.publish(game, "Board {} {}\n".format(game, board))
     for writer in writers:
-        writer.write("Start {}\n".format(hexboard.serialize()).encode())
-        yield from writer.drain()
+        yield from send(writer, "Start {}\n".format(board))
+    plays = 0
     while not hexboard.winner:
-        writers[players[hexboard.current]].write(
-            "Play {}\n".format(hexboard.serialize()).encode())
-        yield from writers[players[hexboard.current]].drain()
+        remaining = clocks[hexboard.current]
+        plays += 1
+        play_id = "{}.{}".format(game, plays)
+        if remaining is None:
+            play_message = "Play {} {}\n".format(serialize(hexboard),
+                                                 play_id)
+        else:
+            play_message = "Play {} {} {:.3f}\n".format(
+                serialize(hexboard), play_id, remaining)
+        yield from send(writers[players[hexboard.current]], play_message)
+        start_time = loop.time()
         try:
-            data = yield from asyncio.wait_for(
-                readers[players[hexboard.current]].readline(), timeout=TIMEOUT)
+            data = yield from read_move(
+                readers[players[hexboard.current]], play_id,
+                TIMEOUT if remaining is None else remaining)
         except asyncio.TimeoutError:
-            print("Timeout for winner {}!".format(hexboard.current))
-            hexboard.winner = (
-                hexgame.RED
-                if hexboard.current == hexgame.BLUE
-                else hexgame.BLUE)
+            print("Timeout for player {}!".format(hexboard.current))
+            hexboard.winner = other_player(hexboard.current)
+            reason = "time"
+        metrics.observe('response', loop.time() - start_time)
+        if remaining is not None:
+            # The clock keeps running until a valid move is received
+            clocks[hexboard.current] = max(
+                0, remaining - (loop.time() - start_time))
+        if not hexboard.winner and not data:
+            print("Disconnection of player {}!".format(hexboard.current))
+            hexboard.winner = other_player(hexboard.current)
+            reason = "disconnection"
         if not hexboard.winner:
-            move = [int(i) for i in data.decode().split('#')]
+            move = [int(i) for i in data.decode().split()[0].split('#')]
             print("Move {} received".format(move))
             sys.stdout.flush()
             try:
-                hexboard.play(*move)
-                writers[1 - players[hexboard.current]].write(
-                    "Ack {}\n".format(hexboard.serialize()).encode())
-                yield from writers[1 - players[hexboard.current]].drain()
+                player = hexboard.current
+                start = time.perf_counter()
+                try:
+                    hexboard.play(*move)
+                finally:
+                    metrics.observe('validation',
+                                    time.perf_counter() - start)
+                moves.append(move)
+                metrics.moves += 1
+                if remaining is not None:
+                    clocks[player] += options.increment
+                board = serialize(hexboard)
+                spectators.publish(game, "Board {} {}\n".format(game, board))
+                yield from send(writers[1 - players[hexboard.current]],
+                                "Ack {}\n".format(board))
             except hexgame.InvalidMoveException:
-                writers[players[hexboard.current]].write(
-                    "InvalidMove\n".encode())
-                yield from writers[players[hexboard.current]].drain()
+                yield from send(writers[players[hexboard.current]],
+                                "InvalidMove\n")
 
+    board = serialize(hexboard)
+    spectators.publish(game, "End {} {}\n".format(game, board))
     for writer in writers:
-        writer.write("End {}\n".format(hexboard.serialize()).encode())
-        yield from writer.drain()
-        writer.close()
+        if not writer.transport.is_closing():
+            yield from send(writer, "End {}\n".format(board))
+    if reason == "time":
+        print("Loss on time for player {}".format(
+            other_player(hexboard.winner)))
     print("Player {} wins. Ending the game"
           .format(hexboard.winner))
     sys.stdout.flush()
-    writers, readers = [], []
-    asyncio.get_event_loop().stop()
+    if options.record:
+        write_record(options.record, {
+            'game': game,
+            'size': options.hexsize,
+            'moves': moves,
+            'winner': hexboard.winner,
+            'reason': reason,
+            'players': {str(player): peername
+                        for player, peername in peernames.items()},
+            'clocks': {str(player): clock
+                       for player, clock in clocks.items()}})
+    return hexboard.winner
 
 
 def main():
@@ -93,17 +476,46 @@ def main():
     Starts the server, waits for connections, plays the game,
     and shuts down gracefully.
     """
-    hexsize = DEFAULT_HEXSIZE
-    if len(sys.argv) > 1:
-        hexsize = int(sys.argv[1])
+    parser = argparse.ArgumentParser()
+    parser.add_argument('hexsize', nargs='?', default=DEFAULT_HEXSIZE,
+                        type=int)
+    parser.add_argument('--port', default=PORT, type=int)
+    parser.add_argument('--games', default=1, type=int,
+                        help='number of games played on the same connections')
+    parser.add_argument('--time', default=None, type=float,
+                        help='time bank of each player, in seconds')
+    parser.add_argument('--increment', default=0, type=float,
+                        help='time added to the bank after each move')
+    parser.add_argument('--record', default=None,
+                        help='file where the game records are appended')
+    parser.add_argument('--spectator-port', default=None, type=int,
+                        help='port where spectators can watch the games')
+    parser.add_argument('--metrics-port', default=None, type=int,
+                        help='port of the plain text metrics endpoint')
+    parser.add_argument('--stats-interval', default=None, type=float,
+                        help='period of the stats lines, in seconds')
+    options = parser.parse_args(sys.argv[1:])
     readers, writers = [], []
     loop = asyncio.get_event_loop()
     coro = asyncio.start_server(
         lambda reader, writer: waiting_for_players(
-            reader, writer, readers, writers, hexsize),
-        HOST, PORT,
+            reader, writer, readers, writers, options),
+        HOST, options.port,
         loop=loop)
     server = loop.run_until_complete(coro)
+    spectator_server, metrics_server, stats_task = None, None, None
+    if options.spectator_port is not None:
+        spectator_server = loop.run_until_complete(asyncio.start_server(
+            handle_spectator, HOST, options.spectator_port, loop=loop))
+        print('Spectators on {}'.format(
+            spectator_server.sockets[0].getsockname()))
+    if options.metrics_port is not None:
+        metrics_server = loop.run_until_complete(asyncio.start_server(
+            serve_metrics, HOST, options.metrics_port, loop=loop))
+        print('Metrics on {}'.format(
+            metrics_server.sockets[0].getsockname()))
+    if options.stats_interval:
+        stats_task = loop.create_task(print_stats(options.stats_interval))
 
     # Serve requests until Ctrl+C is pressed
     print('Serving on {}'.format(server.sockets[0].getsockname()))
@@ -118,6 +530,13 @@ def main():
 
     # Close the server
     print('Closing the server')
+    if stats_task:
+        stats_task.cancel()
+    loop.run_until_complete(spectators.close())
+    for extra_server in (spectator_server, metrics_server):
+        if extra_server:
+            extra_server.close()
+            loop.run_until_complete(extra_server.wait_closed())
     server.close()
     loop.run_until_complete(server.wait_closed())
     loop.close()
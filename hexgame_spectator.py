@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+
+"""
+This module implements a spectator client for the Hex board game:
+it watches the games of a server started with --spectator-port.
+"""
+
+
+import argparse
+import asyncio
+import sys
+import hexdisplay
+import hexgame
+
+HOST = '127.0.0.1'
+PORT = 8889
+
+
+@asyncio.coroutine
+def spectator_client(loop, display, game, host=HOST, port=PORT):
+    """Receives the boards of the watched games and displays them."""
+    reader, writer = yield from asyncio.open_connection(host, port,
+                                                        loop=loop)
+    print("Connected to the game server")
+    sys.stdout.flush()
+    writer.write("Watch {}\n".format(game).encode())
+    yield from writer.drain()
+    display.init_screen()
+    while True:
+        data = yield from reader.readline()
+        if not data:
+            break
+        message = data.decode()
+        print(message.rstrip())
+        if message.startswith("InvalidWatch"):
+            break
+        kind, number, board = message.split(' ', 2)
+        hexboard = hexgame.Hex.create_from_str(board)
+        display.redraw(hexboard)
+        if kind == "End":
+            display.set_title("Hex game {} - {} wins".format(
+                number, hexgame.PLAYER_NAMES[hexboard.winner]))
+        else:
+            display.set_title("Hex game {}".format(number))
+        sys.stdout.flush()
+    writer.close()
+
+
+def main():
+    """Runs the spectator client."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('game', nargs='?', default='all',
+                        help='number of the watched game (all by default)')
+    parser.add_argument('--headless', action='store_true',
+                        default=hexdisplay.default_headless())
+    parser.add_argument('--display', dest='headless', action='store_false')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', default=PORT, type=int)
+    arguments = parser.parse_args(sys.argv[1:])
+    display = hexdisplay.create_display(arguments.headless)
+    loop = asyncio.get_event_loop()
+    try:
+        loop.run_until_complete(spectator_client(
+            loop, display, arguments.game, arguments.host, arguments.port))
+    except KeyboardInterrupt:
+        pass
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,19 +2,28 @@
 
 import math
 import cairo
-import pygame
-from PIL import Image
 import asyncio
+try:
+    import pygame
+except ImportError:  # Off-screen rendering only needs cairo
+    pygame = None
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+import sys
+import threading
+import types
 
 import hexgame
-
-from random import randint
+import hexprofile
 
 # Define the colors we will use in RGB format
 GRAY = (200, 200, 200)
 LIGHT_GRAY = (220, 220, 220)
 BLUE = (31, 119, 180)
 ORANGE = (255, 127, 14)
+HOVER_GRAY = (180, 180, 180)
 
 SIZE = WIDTH, HEIGHT = 800, 600
 
@@ -23,16 +32,33 @@ color_correspondance = {
     hexgame.RED: ORANGE,
     hexgame.EMPTY: LIGHT_GRAY
 }
-player_names = {
-    hexgame.BLUE: "Blue player",
-    hexgame.RED: "Orange player"
-}
+player_names = hexgame.PLAYER_NAMES
 
 screen = None
 loop = None
 event_queue = None
 pygame_task = None
 
+# Incremental rendering: the static background of each board size is
+# drawn once, and the current frame is a cairo surface whose buffer is
+# shared with pygame, on which only the changed cells are repainted.
+backgrounds = {}
+frame = None
+frame_image = None
+frame_shared = False
+frame_grid = None
+hovered = None
+
+# Hit-test rasters, by board and window sizes
+hit_rasters = {}
+
+# The frame is painted by the render worker, and hovered from the event
+# loop; the painted rectangles wait in pending_dirty until the event
+# loop (the main thread) transfers them to the screen
+render_lock = threading.Lock()
+render_worker = None
+pending_dirty = []
+
 
 def pygame_event_loop(loop, event_queue):
     while True:
@@ -50,14 +76,18 @@ def bgra_surf_to_rgba_string(cairo_surface):
     return img.tobytes('raw', 'RGBA', 0, 1)
 
 
-def draw_hexagon(ctx, x, y, r, color=BLUE):
+def hexagon_path(ctx, x, y, r):
     angles = [(2 * i + 1) * math.pi / 6 for i in range(7)]
     xs = [x + r * math.cos(angle) for angle in angles]
     ys = [y + r * math.sin(angle) for angle in angles]
-    ctx.set_line_width(2)
     ctx.move_to(xs[0], ys[0])
     for x, y in zip(xs[1:], ys[1:]):
         ctx.line_to(x, y)
+
+
+def draw_hexagon(ctx, x, y, r, color=BLUE):
+    ctx.set_line_width(2)
+    hexagon_path(ctx, x, y, r)
     ctx.set_source_rgba(*[c / 255 for c in color], 1)
     ctx.fill_preserve()
     ctx.set_source_rgb(1, 1, 1)
@@ -88,7 +118,12 @@ def graphic_parameters(hex):
     return hexa_size, x_stride, y_stride, x_offset, y_offset
 
 
-def draw_hexgame(ctx, hex):
+def cell_center(hex, i, j):
+    hexa_size, x_stride, y_stride, x_offset, y_offset = graphic_parameters(hex)
+    return x_offset + i * x_stride / 2 + x_stride * j, y_offset + y_stride * i
+
+
+def draw_edges(ctx, hex):
     hexa_size, x_stride, y_stride, x_offset, y_offset = graphic_parameters(hex)
 
     upper_left = x_offset - 1.5 * x_stride, y_offset - 1.5 * hexa_size
@@ -107,6 +142,12 @@ def draw_hexgame(ctx, hex):
     draw_polygon(ctx, [lower_left, lower_right, center], ORANGE)
     draw_polygon(ctx, [lower_left, upper_left, center], BLUE)
 
+
+def draw_hexgame(ctx, hex):
+    hexa_size, x_stride, y_stride, x_offset, y_offset = graphic_parameters(hex)
+
+    draw_edges(ctx, hex)
+
     for i in range(hex.size):
         for j in range(hex.size):
             draw_hexagon(ctx,
@@ -116,53 +157,238 @@ def draw_hexgame(ctx, hex):
                          color_correspondance[hex.grid[i][j]])
 
 
-def distance(x1, y1, x2, y2):
-    return (x1 - x2) ** 2 + (y1 - y2) ** 2
+def get_hit_raster(hex):
+    """
+    Returns the hit-test raster of the board size (built once for each
+    board and window size): the cell id + 1 of each pixel, 0 outside of
+    the board. Each hexagon is filled with its id as color, without
+    antialiasing, on an off-screen surface.
+    """
+    key = hex.size, WIDTH, HEIGHT
+    if key not in hit_rasters:
+        hexa_size = graphic_parameters(hex)[0]
+        surface = cairo.ImageSurface(cairo.FORMAT_RGB24, WIDTH, HEIGHT)
+        ctx = cairo.Context(surface)
+        ctx.set_antialias(cairo.ANTIALIAS_NONE)
+        for i in range(hex.size):
+            for j in range(hex.size):
+                cell_id = i * hex.size + j + 1
+                x, y = cell_center(hex, i, j)
+                # Slightly larger hexagons, so that borders are covered
+                hexagon_path(ctx, x, y, hexa_size + 1)
+                ctx.set_source_rgb((cell_id >> 16) / 255,
+                                   ((cell_id >> 8) & 255) / 255,
+                                   (cell_id & 255) / 255)
+                ctx.fill()
+        surface.flush()
+        hit_rasters[key] = (memoryview(bytes(surface.get_data())).cast('I'),
+                            surface.get_stride() // 4)
+    return hit_rasters[key]
 
 
 def get_case_from_pixel(hex, x, y):
-    hexa_size, x_stride, y_stride, x_offset, y_offset = graphic_parameters(hex)
-
-    row = (y - y_offset + hexa_size) / y_stride
-    col = (x - x_offset - x_stride * int(row) / 2 + x_stride / 2) / x_stride
-
-    current_row, current_col = int(row), int(col)
-    current_dist = float("+inf")
-    for i in range(max(0, int(row) - 1), min(hex.size, int(row) + 1)):
-        for j in range(max(0, int(col) - 1), min(hex.size, int(col) + 1)):
-            if distance(x, y,
-                        x_offset + i * x_stride / 2 + x_stride * j,
-                        y_offset + y_stride * i) < current_dist:
-                current_dist = distance(x, y,
-                                        x_offset + i * x_stride / 2
-                                        + x_stride * j,
-                                        y_offset + y_stride * i)
-                current_row, current_col = i, j
-
-    return current_row, current_col
+    """Returns the cell under a pixel, (-1, -1) outside of the board."""
+    if not (0 <= x < WIDTH and 0 <= y < HEIGHT):
+        return -1, -1
+    raster, stride = get_hit_raster(hex)
+    cell_id = (raster[y * stride + x] & 0xFFFFFF) - 1
+    if cell_id < 0:
+        return -1, -1
+    return cell_id // hex.size, cell_id % hex.size
+
+
+def get_background(size):
+    """Returns the static background (edges, empty board) of a size."""
+    if size not in backgrounds:
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, WIDTH, HEIGHT)
+        ctx = cairo.Context(surface)
+        ctx.set_source_rgb(*[c / 255 for c in GRAY])
+        ctx.paint()
+        draw_hexgame(ctx, hexgame.Hex(size))
+        surface.flush()
+        backgrounds[size] = surface
+    return backgrounds[size]
+
+
+def cairo_to_pygame(cairo_surface):
+    """
+    Returns a pygame surface sharing the pixels of the cairo surface
+    when pygame supports it (pygame >= 2.1.3), a converted copy
+    otherwise. The second value tells whether the pixels are shared.
+    """
+    try:
+        return pygame.image.frombuffer(cairo_surface.get_data(),
+                                       SIZE, "BGRA"), True
+    except ValueError:
+        return pygame.image.frombuffer(
+            bgra_surf_to_rgba_string(cairo_surface), SIZE, "RGBA"), False
+
+
+def new_frame(size):
+    global frame, frame_image, frame_shared, frame_grid, hovered
+    frame = cairo.ImageSurface(cairo.FORMAT_ARGB32, WIDTH, HEIGHT)
+    ctx = cairo.Context(frame)
+    ctx.set_source_surface(get_background(size), 0, 0)
+    ctx.paint()
+    frame.flush()
+    # The pygame image is made by the main thread, see present
+    frame_image = None
+    frame_grid = [[hexgame.EMPTY] * size for _ in range(size)]
+    hovered = None
+
+
+def paint_cell(ctx, hex, i, j, color):
+    """Paints a cell of the frame, returns the rectangle to update."""
+    hexa_size = graphic_parameters(hex)[0]
+    x, y = cell_center(hex, i, j)
+    draw_hexagon(ctx, x, y, hexa_size, color)
+    return pygame.Rect(int(x - hexa_size) - 2, int(y - hexa_size) - 2,
+                       int(2 * hexa_size) + 4, int(2 * hexa_size) + 4)
+
+
+def present():
+    """
+    Transfers the pending dirty rectangles of the frame to the screen.
+    The pygame display calls must stay on the main thread: this is
+    called from the event loop, never from the render worker.
+    """
+    global frame_image, frame_shared
+    with render_lock:
+        dirty = pending_dirty[:]
+        del pending_dirty[:]
+        if screen is None or not dirty:
+            return
+        frame.flush()
+        if frame_image is None or not frame_shared:
+            # A new frame, or a copy of the pixels: convert the frame again
+            frame_image, frame_shared = cairo_to_pygame(frame)
+        for rect in dirty:
+            screen.blit(frame_image, rect, rect)
+    pygame.display.update(dirty)
+
+
+class RenderWorker():
+    """
+    The RenderWorker class paints the posted boards with cairo in a
+    dedicated thread, so that drawing never blocks the event loop, and
+    hands the painted rectangles to the event loop, which updates the
+    screen. When the worker falls behind, intermediate boards are
+    skipped and only the newest one is painted.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.pending = None
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def post(self, hex):
+        """Posts a snapshot of the board, replacing any pending one."""
+        snapshot = types.SimpleNamespace(size=hex.size,
+                                         grid=[row[:] for row in hex.grid],
+                                         winner=hex.winner)
+        with self.condition:
+            self.pending = snapshot
+            self.condition.notify()
+
+    def stop(self):
+        """Stops the worker once the pending board is drawn."""
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and self.running:
+                    self.condition.wait()
+                if self.pending is None:
+                    return
+                snapshot, self.pending = self.pending, None
+            with render_lock:
+                painted = render(snapshot)
+            if painted:
+                loop.call_soon_threadsafe(present)
+
+
+def post_redraw(hex):
+    """Asks the render worker to draw the board."""
+    render_worker.post(hex)
 
 
 def redraw(hex):
-    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, WIDTH, HEIGHT)
-    ctx = cairo.Context(surface)
-
-    draw_hexgame(ctx, hex)
-
-    # Create PyGame surface from Cairo Surface
-    buf = bgra_surf_to_rgba_string(surface)
-    image = pygame.image.frombuffer(buf, SIZE, "RGBA")
-    # Tranfer to Screen
-    screen.fill(GRAY)
-    screen.blit(image, (0, 0))
-    pygame.display.flip()
+    """Draws the board and updates the screen, from the main thread."""
+    with render_lock:
+        render(hex)
+    present()
+
+
+def render(hex):
+    """
+    Paints the cells of the frame which changed, with cairo only, and
+    adds their rectangles to pending_dirty (the caller holds
+    render_lock). Returns whether anything was painted.
+    """
+    full_redraw = frame_grid is None or len(frame_grid) != hex.size
+    if full_redraw:
+        new_frame(hex.size)
+
+    # Only the cells which changed since the last frame are repainted
+    ctx = cairo.Context(frame)
+    dirty = []
+    for i in range(hex.size):
+        for j in range(hex.size):
+            if hex.grid[i][j] != frame_grid[i][j]:
+                dirty.append(paint_cell(ctx, hex, i, j,
+                                        color_correspondance[hex.grid[i][j]]))
+                frame_grid[i][j] = hex.grid[i][j]
+
+    # Transferred to the screen by present
+    if full_redraw:
+        pending_dirty.append(pygame.Rect(0, 0, WIDTH, HEIGHT))
+    else:
+        pending_dirty.extend(dirty)
+    return full_redraw or bool(dirty)
+
+
+def hover(hex, row, col):
+    """Highlights the empty cell under the mouse pointer."""
+    with render_lock:
+        _hover(hex, row, col)
+    present()
+
+
+def _hover(hex, row, col):
+    global hovered
+    if frame_grid is None or len(frame_grid) != hex.size:
+        return
+    cell = None
+    if 0 <= row < hex.size and 0 <= col < hex.size \
+            and frame_grid[row][col] == hexgame.EMPTY:
+        cell = row, col
+    if cell == hovered:
+        return
+    ctx = cairo.Context(frame)
+    dirty = []
+    if hovered:
+        i, j = hovered
+        dirty.append(paint_cell(ctx, hex, i, j,
+                                color_correspondance[frame_grid[i][j]]))
+    if cell:
+        dirty.append(paint_cell(ctx, hex, row, col, HOVER_GRAY))
+    hovered = cell
+    pending_dirty.extend(dirty)
 
 
 def set_title(title):
-    loop.run_in_executor(None, pygame.display.set_caption, title)
+    # A display call: on the main thread, as the screen updates
+    loop.call_soon_threadsafe(pygame.display.set_caption, title)
 
 
 def init_screen():
-    global screen, loop, event_queue, pygame_task
+    global screen, loop, event_queue, pygame_task, render_worker
     loop = asyncio.get_event_loop()
     event_queue = asyncio.Queue()
     pygame.init()
@@ -170,9 +396,16 @@ def init_screen():
     screen = pygame.display.get_surface()
     pygame_task = loop.run_in_executor(None, pygame_event_loop, loop,
                                        event_queue)
+    render_worker = RenderWorker()
 
 
 def teardown_screen():
+    global screen, render_worker
+    if render_worker:
+        render_worker.stop()
+        render_worker = None
+    # The rectangles still pending are not presented any more
+    screen = None
     pygame_task.cancel()
     pygame.display.quit()
     pygame.quit()
@@ -185,8 +418,12 @@ def handle_events(hex, button_callback):
         if event.type == pygame.QUIT:
             teardown_screen()
             break
+        if hex is None:
+            continue
+        if event.type == pygame.MOUSEMOTION:
+            hover(hex, *get_case_from_pixel(hex, *event.pos))
         if event.type == pygame.MOUSEBUTTONDOWN:
-            row, col = randint(0,10), randint(0,10)
+            row, col = get_case_from_pixel(hex, *event.pos)
             if row >= 0 and row < hex.size and col >= 0 and col < hex.size:
                 if button_callback:
                     yield from button_callback(hex, row, col)
@@ -201,8 +438,10 @@ def wait_for_next_click(hex, button_callback):
         if event.type == pygame.QUIT:
             teardown_screen()
             break
-        if not hex.winner:
-            row, col = randint(0,10), randint(0,10)
+        if event.type == pygame.MOUSEMOTION:
+            hover(hex, *get_case_from_pixel(hex, *event.pos))
+        if event.type == pygame.MOUSEBUTTONDOWN and not hex.winner:
+            row, col = get_case_from_pixel(hex, *event.pos)
             if row >= 0 and row < hex.size and col >= 0 and col < hex.size:
                 stop_loop = True
     yield from button_callback(hex, row, col)
@@ -218,6 +457,10 @@ def _default_button_callback(hex, row, col):
             print("{} WINS!!!!".format(player_names[winner]))
 
 
+hexprofile.register(sys.modules[__name__], 'hexgui',
+                    ['redraw', 'render', 'present'])
+
+
 def main():
     init_screen()
 
@@ -0,0 +1,172 @@
+#!/usr/bin/python3
+
+"""
+This module provides opt-in profiling of the clients, enabled by the
+HEX_PROFILE environment variable or by the --profile option of the
+clients.
+
+Modules register their hot functions (e.g. make_graph, djikstra and
+find_best in djikstra.py) with register(). When profiling is enabled,
+these functions are replaced by timed wrappers; when it is disabled,
+nothing is replaced, so there is no overhead at all. Functions can
+also count events (nodes expanded, cache hits...) with count(), behind
+an `if hexprofile.enabled` test. hexgame.py, which depends on nothing,
+is registered from here when profiling is enabled.
+
+After each move, a summary is written as a JSON line (to the standard
+error, or to HEX_PROFILE_OUTPUT / --profile-output): the duration of
+the move, and the calls, inclusive durations and counters accumulated
+since the previous move. With a latency threshold (HEX_PROFILE_THRESHOLD
+/ --profile-threshold, in seconds), every move is run under cProfile,
+and the statistics of the moves lasting longer are dumped to
+hexprofile-<pid>-<move>.prof files (see the pstats module).
+"""
+
+import cProfile
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+
+
+enabled = False
+output = None
+threshold = None
+
+# (owner, attribute, phase name) of the registered functions
+registry = []
+phases = {}
+counters = {}
+lock = threading.Lock()
+moves = 0
+
+
+def register(owner, phase, names):
+    """
+    Registers functions to be timed when profiling is enabled.
+
+    Arguments:
+    - The module or class owning the functions.
+    - The prefix of the phase names, e.g. the module name.
+    - The names of the functions.
+    """
+    for name in names:
+        entry = (owner, name, "{}.{}".format(phase, name))
+        registry.append(entry)
+        if enabled:
+            _instrument(*entry)
+
+
+def _instrument(owner, name, phase):
+    function = getattr(owner, name)
+
+    @functools.wraps(function)
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with lock:
+                calls, seconds = phases.get(phase, (0, 0))
+                phases[phase] = calls + 1, seconds + elapsed
+
+    if isinstance(inspect.getattr_static(owner, name), staticmethod):
+        timed = staticmethod(timed)
+    setattr(owner, name, timed)
+
+
+def count(name, number=1):
+    """Adds number to a counter (call only if profiling is enabled)."""
+    with lock:
+        counters[name] = counters.get(name, 0) + number
+
+
+def enable(output_file=None, latency_threshold=None):
+    """
+    Enables profiling: instruments the registered functions.
+
+    Arguments:
+    - The file where the move summaries are appended (standard error
+      by default).
+    - The duration (in seconds) above which the cProfile statistics
+      of a move are dumped, or None.
+    """
+    global enabled, output, threshold
+    output = output_file or os.environ.get('HEX_PROFILE_OUTPUT')
+    threshold = latency_threshold
+    if threshold is None and os.environ.get('HEX_PROFILE_THRESHOLD'):
+        threshold = float(os.environ['HEX_PROFILE_THRESHOLD'])
+    if not enabled:
+        _register_game()
+        enabled = True
+        for entry in registry:
+            _instrument(*entry)
+
+
+def _register_game():
+    """Registers the hot functions of hexgame.py, imported on demand."""
+    import hexgame
+    register(hexgame.Hex, 'hexgame.Hex', ['create_from_str', 'serialize'])
+
+
+def profiled_move(choose_move):
+    """
+    Returns choose_move, wrapped so that each call writes a move
+    summary when profiling is enabled.
+    """
+    if not enabled:
+        return choose_move
+
+    @functools.wraps(choose_move)
+    def wrapper(hexboard, time_budget):
+        # cProfile only sees the thread it is enabled in
+        profiler = cProfile.Profile() if threshold is not None else None
+        start = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            return choose_move(hexboard, time_budget)
+        finally:
+            if profiler:
+                profiler.disable()
+            summarize(hexboard, time.perf_counter() - start, profiler)
+    return wrapper
+
+
+def summarize(hexboard, elapsed, profiler=None):
+    """Writes the summary of a move, and resets the measures."""
+    global moves
+    with lock:
+        moves += 1
+        number = moves
+        summary = {
+            'pid': os.getpid(),
+            'move': number,
+            'size': hexboard.size,
+            'stones': sum(hexboard.size - row.count(0)  # Empty cells
+                          for row in hexboard.grid),
+            'seconds': elapsed,
+            'phases': {phase: {'calls': calls, 'seconds': seconds}
+                       for phase, (calls, seconds) in phases.items()},
+            'counters': dict(counters)}
+        phases.clear()
+        counters.clear()
+    if profiler and elapsed >= threshold:
+        summary['profile'] = "hexprofile-{}-{}.prof".format(os.getpid(),
+                                                             number)
+        profiler.dump_stats(summary['profile'])
+    line = json.dumps(summary) + "\n"
+    if output:
+        with open(output, 'a') as output_file:
+            output_file.write(line)
+    else:
+        sys.stderr.write(line)
+        sys.stderr.flush()
+
+
+if os.environ.get('HEX_PROFILE'):
+    enable()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+"""
+This module implements move priors based on local patterns.
+
+The pattern of a cell is the colors of the cells around it, encoded
+as an integer in base 3: the 6 cells at distance 1 give the radius-1
+code (3^6 codes), and the 12 cells at distance 2 extend it into the
+radius-2 code (3^18 codes). Cells off the board take the color of the
+corresponding edge (Blue on the left and right, Red at the top and
+bottom).
+
+A PatternTracker follows a Hex board and updates the codes of the
+cells around each new stone, so that the prior of a move is a table
+lookup. As in evaluator.py, Red sees the transposed board with the
+colors swapped, so that a single PatternTable serves both players.
+"""
+
+
+import argparse
+import json
+import random
+import sys
+
+import hexgame
+
+
+# The cells at distance 1, in the order of the pattern digits
+RING_1 = [(-1, 0), (-1, 1), (0, 1), (1, 0), (1, -1), (0, -1)]
+# The cells at distance 2
+RING_2 = [(d_i, d_j) for d_i in range(-2, 3) for d_j in range(-2, 3)
+          if (abs(d_i) + abs(d_j) + abs(d_i + d_j)) // 2 == 2]
+OFFSETS = RING_1 + RING_2
+RADIUS_1_CODES = 3 ** len(RING_1)
+SWAPPED = {hexgame.EMPTY: hexgame.EMPTY, hexgame.BLUE: hexgame.RED,
+           hexgame.RED: hexgame.BLUE}
+DEFAULT_TABLE = 'patterns.json'
+
+
+def off_board_color(size, i, j):
+    """Returns the color of a cell, off the board, seen as an edge."""
+    if not 0 <= j < size:
+        return hexgame.BLUE
+    return hexgame.RED
+
+
+def cell_code(grid, size, i, j):
+    """Returns the radius-2 code of a cell, computed from scratch."""
+    code = 0
+    for digit, (d_i, d_j) in enumerate(OFFSETS):
+        k, l = i + d_i, j + d_j
+        if 0 <= k < size and 0 <= l < size:
+            color = grid[k][l]
+        else:
+            color = off_board_color(size, k, l)
+        code += color * 3 ** digit
+    return code
+
+
+class PatternTracker():
+    """
+    The PatternTracker class maintains the pattern codes of all the
+    cells of a Hex board, seen by both players, as stones are played.
+    """
+
+    def __init__(self, hexboard):
+        self.hexboard = hexboard
+        size = hexboard.size
+        transposed = [[SWAPPED[hexboard.grid[j][i]] for j in range(size)]
+                      for i in range(size)]
+        self.codes = {
+            hexgame.BLUE: [cell_code(hexboard.grid, size, i, j)
+                           for i in range(size) for j in range(size)],
+            hexgame.RED: [cell_code(transposed, size, i, j)
+                          for i in range(size) for j in range(size)]}
+
+    def place(self, i, j, color):
+        """Updates the codes around a stone placed on the board."""
+        size = self.hexboard.size
+        for player, (k, l), stone in (
+                (hexgame.BLUE, (i, j), color),
+                (hexgame.RED, (j, i), SWAPPED[color])):
+            codes = self.codes[player]
+            for digit, (d_i, d_j) in enumerate(OFFSETS):
+                # The stone is at offset (d_i, d_j) of this cell
+                m, n = k - d_i, l - d_j
+                if 0 <= m < size and 0 <= n < size:
+                    codes[m * size + n] += stone * 3 ** digit
+
+    def play(self, i, j):
+        """Plays a move on the board and updates the codes."""
+        color = self.hexboard.current
+        winner = self.hexboard.play(i, j)
+        self.place(i, j, color)
+        return winner
+
+    def code(self, i, j, player=None):
+        """
+        Returns the radius-2 code of a cell, seen by a player (by
+        default the player to move). The radius-1 code is the code
+        modulo RADIUS_1_CODES.
+        """
+        player = player or self.hexboard.current
+        if player == hexgame.RED:
+            i, j = j, i
+        return self.codes[player][i * self.hexboard.size + j]
+
+
+class PatternTable():
+    """
+    The PatternTable class maps pattern codes to move urgencies: the
+    radius-2 table is used when the pattern is known, the radius-1
+    table otherwise.
+    """
+
+    def __init__(self, radius_1=None, radius_2=None, default=1.0):
+        self.radius_1 = radius_1 or [default] * RADIUS_1_CODES
+        self.radius_2 = radius_2 or {}
+
+    @staticmethod
+    def load(path=DEFAULT_TABLE):
+        """Loads a table saved by save."""
+        with open(path) as table_file:
+            table = json.load(table_file)
+        return PatternTable(table['radius_1'],
+                            {int(code): urgency for code, urgency
+                             in table['radius_2'].items()})
+
+    def save(self, path=DEFAULT_TABLE):
+        """Saves the table as JSON."""
+        with open(path, 'w') as table_file:
+            json.dump({'radius_1': self.radius_1,
+                       'radius_2': {str(code): urgency for code, urgency
+                                    in self.radius_2.items()}},
+                      table_file)
+
+    def urgency(self, code):
+        """Returns the urgency of a radius-2 code."""
+        urgency = self.radius_2.get(code)
+        if urgency is None:
+            urgency = self.radius_1[code % RADIUS_1_CODES]
+        return urgency
+
+    def prior(self, tracker, i, j):
+        """Returns the urgency of a move for the player to move."""
+        return self.urgency(tracker.code(i, j))
+
+    def sample_move(self, tracker, rng=random):
+        """Draws an empty cell with a probability proportional to its
+        urgency, e.g. for playouts."""
+        hexboard = tracker.hexboard
+        cells = [(i, j) for i in range(hexboard.size)
+                 for j in range(hexboard.size)
+                 if hexboard.grid[i][j] == hexgame.EMPTY]
+        weights = [self.prior(tracker, i, j) for i, j in cells]
+        return rng.choices(cells, weights)[0]
+
+
+def build_table(data, size, samples, min_count=20):
+    """
+    Builds a table from self-play samples: the urgency of a pattern is
+    the (smoothed) rate at which an empty cell with this pattern was
+    played. Radius-2 patterns seen less than min_count times are left
+    to the radius-1 table.
+    """
+    import numpy as np
+    import selfplay
+
+    batch = selfplay.ShardReader(data, size).sample(samples)
+    played = [{}, {}]
+    seen = [{}, {}]
+    for board, to_move, move in zip(batch['board'], batch['to_move'],
+                                    batch['move']):
+        hexboard = hexgame.Hex(size)
+        hexboard.grid = board.tolist()
+        hexboard.current = int(to_move)
+        tracker = PatternTracker(hexboard)
+        move_cell = divmod(int(move), size)
+        for i, j in zip(*np.nonzero(board == hexgame.EMPTY)):
+            code = tracker.code(i, j)
+            for table, key in ((0, code % RADIUS_1_CODES), (1, code)):
+                seen[table][key] = seen[table].get(key, 0) + 1
+                if (i, j) == move_cell:
+                    played[table][key] = played[table].get(key, 0) + 1
+
+    # Urgencies are relative to the mean rate at which a cell is played
+    mean_rate = (sum(played[0].values()) + 1) / (sum(seen[0].values()) + 1)
+
+    def urgency(table, key):
+        return ((played[table].get(key, 0) + mean_rate * min_count)
+                / (seen[table][key] + min_count) / mean_rate)
+
+    radius_1 = [urgency(0, code) if code in seen[0] else 1.0
+                for code in range(RADIUS_1_CODES)]
+    radius_2 = {code: urgency(1, code) for code, count in seen[1].items()
+                if count >= min_count}
+    return PatternTable(radius_1, radius_2)
+
+
+def main():
+    """Builds a pattern table from self-play data."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('data', help='self-play data directory')
+    parser.add_argument('--size', default=11, type=int)
+    parser.add_argument('--samples', default=100000, type=int)
+    parser.add_argument('--min-count', default=20, type=int)
+    parser.add_argument('--output', default=DEFAULT_TABLE)
+    arguments = parser.parse_args(sys.argv[1:])
+    table = build_table(arguments.data, arguments.size, arguments.samples,
+                        arguments.min_count)
+    table.save(arguments.output)
+    print("{} radius-2 patterns".format(len(table.radius_2)))
+
+
+if __name__ == '__main__':
+    main()
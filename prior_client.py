@@ -0,0 +1,36 @@
+#!/usr/bin/python3
+
+"""
+This module implements a client for the Hex board game playing the
+moves of highest prior of the learned evaluator (see evaluator.py).
+"""
+
+import evaluator
+import hexclient
+
+
+class PriorPlayer(hexclient.Player):
+    """A player choosing the move of highest prior."""
+
+    def __init__(self, position_evaluator=None):
+        super().__init__()
+        self.evaluator = position_evaluator
+
+    def on_start(self, hexboard, color):
+        super().on_start(hexboard, color)
+        if self.evaluator is None:
+            self.evaluator = evaluator.Evaluator.load()
+
+    def choose_move(self, hexboard, time_budget):
+        priors = self.evaluator.move_priors([hexboard.grid],
+                                            [hexboard.current])[0]
+        return divmod(int(priors.argmax()), hexboard.size)
+
+
+def main():
+    """Runs the client."""
+    hexclient.main(PriorPlayer())
+
+
+if __name__ == '__main__':
+    main()
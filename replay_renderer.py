@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+"""
+This module renders recorded games (the JSON lines written by the
+server with --record) as PNG frame sequences or animated GIFs, using
+the hexgui drawing routines on off-screen cairo surfaces: no window
+and no pygame are needed. The games are rendered in parallel by a
+pool of processes, each one drawing the static background of a board
+size once and then only the played stones.
+"""
+
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+
+import cairo
+
+import hexgame
+import hexgui
+
+
+GIF_FRAME_DURATION = 300  # Milliseconds
+GIF_LAST_FRAME_DURATION = 3000
+
+
+def read_records(filenames, winner=None, games=None, player=None):
+    """
+    Returns the game records of the given files.
+
+    Arguments:
+    - The record files.
+    - winner: if given, only the games won by this player are kept.
+    - games: if given, only the games of these numbers (in their
+      session, see the --games option of the server) are kept.
+    - player: if given, only the games of the players whose peer name
+      (e.g. "('127.0.0.1', 54321)") contains this text are kept.
+    """
+    records = []
+    for filename in filenames:
+        with open(filename) as record_file:
+            for line in record_file:
+                if line.strip():
+                    record = json.loads(line)
+                    if (winner is None or record['winner'] == winner) \
+                            and (games is None
+                                 or record.get('game') in games) \
+                            and (player is None or any(
+                                player in peername for peername
+                                in record.get('players', {}).values())):
+                        records.append(record)
+    return records
+
+
+def render_frames(record):
+    """
+    Replays a recorded game and yields a cairo surface after each move
+    (the same surface, updated in place), starting with the empty board.
+    """
+    hexboard = hexgame.Hex(record['size'])
+    hexa_size = hexgui.graphic_parameters(hexboard)[0]
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32,
+                                 hexgui.WIDTH, hexgui.HEIGHT)
+    ctx = cairo.Context(surface)
+    ctx.set_source_surface(hexgui.get_background(hexboard.size), 0, 0)
+    ctx.paint()
+    surface.flush()
+    yield surface
+    for i, j in record['moves']:
+        color = hexgui.color_correspondance[hexboard.current]
+        hexboard.play(i, j)
+        x, y = hexgui.cell_center(hexboard, i, j)
+        hexgui.draw_hexagon(ctx, x, y, hexa_size, color)
+        surface.flush()
+        yield surface
+
+
+def render_game(job):
+    """
+    Renders a game into the output directory, either as numbered PNG
+    frames in a sub-directory, or as an animated GIF.
+    Returns the path of what was written.
+    """
+    number, record, output, image_format = job
+    name = os.path.join(output, "game{:05d}".format(number))
+    if image_format == 'png':
+        os.makedirs(name, exist_ok=True)
+        for index, surface in enumerate(render_frames(record)):
+            surface.write_to_png(os.path.join(name,
+                                              "{:03d}.png".format(index)))
+        return name
+    images = [hexgui.Image.frombytes(
+        'RGBA', hexgui.SIZE,
+        hexgui.bgra_surf_to_rgba_string(surface)).convert('RGB')
+              for surface in render_frames(record)]
+    durations = ([GIF_FRAME_DURATION] * (len(images) - 1)
+                 + [GIF_LAST_FRAME_DURATION])
+    images[0].save(name + ".gif", save_all=True, append_images=images[1:],
+                   duration=durations, loop=0)
+    return name + ".gif"
+
+
+def main():
+    """Renders the games of the given record files."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('records', nargs='+', help='game record files')
+    parser.add_argument('--output', default='replays')
+    parser.add_argument('--format', choices=['png', 'gif'], default='gif')
+    parser.add_argument('--winner', default=None, type=int,
+                        choices=[hexgame.BLUE, hexgame.RED],
+                        help='only render the games won by this player')
+    parser.add_argument('--game', default=None, type=int, action='append',
+                        help='only render the games of this number in their'
+                        ' session (can be repeated)')
+    parser.add_argument('--player', default=None,
+                        help='only render the games of the players whose'
+                        ' peer name contains this text (address or port)')
+    parser.add_argument('--workers', default=os.cpu_count(), type=int)
+    arguments = parser.parse_args(sys.argv[1:])
+    if arguments.format == 'gif' and hexgui.Image is None:
+        parser.error('PIL is needed to write GIF files')
+
+    records = read_records(arguments.records, arguments.winner,
+                           arguments.game, arguments.player)
+    os.makedirs(arguments.output, exist_ok=True)
+    jobs = [(number, record, arguments.output, arguments.format)
+            for number, record in enumerate(records)]
+    with multiprocessing.Pool(arguments.workers) as pool:
+        for path in pool.imap_unordered(render_game, jobs):
+            print(path)
+            sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
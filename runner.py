@@ -4,7 +4,9 @@
 This module is intended to run batches of games between clients.
 It uses three subprocesses for each game: one for the server, and
 two for the clients. Synchronization ensures that the games are
-run sequentially (not in parallel).
+run sequentially (not in parallel). With --session, the three
+subprocesses are started once and play the whole batch over the
+same connections.
 """
 
 
@@ -13,6 +15,7 @@ import threading
 import sys
 import argparse
 import logging
+import re
 
 
 SERVER_PATH = './hexgame_server.py'
@@ -20,12 +23,24 @@ CLIENT1 = './random_client.py'
 CLIENT2 = './random_client.py'
 LOG_LEVEL = logging.INFO
 LOG_FILE = None
+# The line of the server announcing the winner of a game
+WINNER_LINE = re.compile(r'Player ([12]) wins')
 
 
-def run_server(server_evt, winners, hexsize=11):
+def winner_number(line):
+    """
+    Returns the number (1 or 2) of the player announced as the winner
+    by a line of the server, or None for the other lines.
+    """
+    match = WINNER_LINE.match(line)
+    return int(match.group(1)) if match else None
+
+
+def run_server(server_evt, winners, hexsize=11, games=1):
     """Runs the server as a subprocess."""
     winning_client = None
-    with Popen([SERVER_PATH, str(hexsize)], stdout=PIPE) as proc:
+    with Popen([SERVER_PATH, str(hexsize), '--games', str(games)],
+               stdout=PIPE) as proc:
         client_peernames = []
         while proc.poll() is None:
             line = proc.stdout.readline().decode()
@@ -41,8 +56,9 @@ def run_server(server_evt, winners, hexsize=11):
                            for s in line[15:].split('/')]
                 logging.info('Player 1 → %s / Player 2 → %s',
                              players[0], players[1])
-            if line.startswith('Player'):
-                winner = players[int(line[7]) - 1]
+            number = winner_number(line)
+            if number:
+                winner = players[number - 1]
                 winning_client = client_peernames.index(winner)
                 logging.info(
                     'The winner is %s (client %s)', winner,
@@ -51,7 +67,7 @@ def run_server(server_evt, winners, hexsize=11):
             sys.stdout.flush()
 
 
-def run_client(server_evt, client_evt, client, num):
+def run_client(server_evt, client_evt, client, num, client_args=()):
     """Runs a client as a subprocess."""
     if num == 1:
         server_evt.wait()
@@ -60,7 +76,8 @@ def run_client(server_evt, client_evt, client, num):
     connection_success = False
     attempts = 10
     while not connection_success and attempts:
-        with Popen([client], stdout=PIPE, stderr=STDOUT) as proc:
+        with Popen([client] + list(client_args),
+                   stdout=PIPE, stderr=STDOUT) as proc:
             while proc.poll() is None:
                 out = proc.stdout.readline().decode()
                 if out.startswith('ConnectionRefusedError'):
@@ -84,22 +101,36 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--batch', nargs=1, default=[1], type=int)
     parser.add_argument('--hexsize', nargs=1, default=[11], type=int)
+    parser.add_argument('--session', action='store_true',
+                        help='play the whole batch on a single connection')
+    parser.add_argument('--display', action='store_true',
+                        help='show the clients windows (headless otherwise)')
     arguments = vars(parser.parse_args(sys.argv[1:]))
     server_evt, client_evt = threading.Event(), threading.Event()
+    client_args = [] if arguments['display'] else ['--headless']
+
+    # In session mode, a single server plays all the games of the batch
+    if arguments['session']:
+        runs, games = 1, arguments['batch'][0]
+    else:
+        runs, games = arguments['batch'][0], 1
 
     winners = [0, 0]
-    for batch_number in range(arguments['batch'][0]):
+    for batch_number in range(runs):
         logging.info("### Game number %d", batch_number + 1)
         t_server = threading.Thread(target=run_server,
                                     args=(server_evt,
                                           winners,
-                                          arguments['hexsize'][0]))
+                                          arguments['hexsize'][0],
+                                          games))
         t_client1 = threading.Thread(target=run_client, args=(server_evt,
                                                               client_evt,
-                                                              CLIENT1, 1))
+                                                              CLIENT1, 1,
+                                                              client_args))
         t_client2 = threading.Thread(target=run_client, args=(server_evt,
                                                               client_evt,
-                                                              CLIENT2, 2))
+                                                              CLIENT2, 2,
+                                                              client_args))
         t_server.start()
         t_client1.start()
         t_client2.start()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+
+"""
+This module generates self-play training data: games between two
+instances of a player (any hexclient.Player subclass, given as
+module:Class) are played on several cores, and every position is
+stored as a sample (board, side to move, final winner, chosen move).
+
+Samples are written to fixed-size shards, which are NumPy .npy files
+opened as memory maps, with boards packed on 2 bits per cell. An
+index (index.json) lists the shards of the data directory and their
+number of samples, so that ShardReader can sample random positions
+over all the shards without loading them into memory.
+"""
+
+
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import random
+import sys
+import uuid
+
+import numpy as np
+
+import hexgame
+
+
+SHARD_SAMPLES = 1 << 16
+INDEX_FILE = 'index.json'
+
+
+def sample_dtype(size):
+    """Returns the NumPy record type of the samples of a board size."""
+    return np.dtype([('board', np.uint8, ((size * size + 3) // 4,)),
+                     ('to_move', np.uint8),
+                     ('winner', np.uint8),
+                     ('move', np.uint16)])
+
+
+def pack_boards(boards):
+    """
+    Packs boards (an array of shape (n, size, size) or (n, size * size)
+    of EMPTY, BLUE and RED values) on 2 bits per cell.
+    """
+    cells = np.asarray(boards, dtype=np.uint8).reshape(len(boards), -1)
+    padding = -cells.shape[1] % 4
+    cells = np.pad(cells, ((0, 0), (0, padding)))
+    cells = cells.reshape(len(boards), -1, 4)
+    return (cells[:, :, 0] | cells[:, :, 1] << 2
+            | cells[:, :, 2] << 4 | cells[:, :, 3] << 6)
+
+
+def unpack_boards(packed, size):
+    """Unpacks boards packed by pack_boards, shape (n, size, size)."""
+    packed = np.asarray(packed, dtype=np.uint8)
+    cells = (packed[:, :, np.newaxis] >> np.array([0, 2, 4, 6],
+                                                  dtype=np.uint8)) & 3
+    cells = cells.reshape(len(packed), -1)[:, :size * size]
+    return cells.reshape(len(packed), size, size)
+
+
+class ShardWriter():
+    """
+    The ShardWriter class writes the samples of a board size to
+    memory-mapped shards of SHARD_SAMPLES samples.
+    """
+
+    def __init__(self, directory, size, shard_samples=SHARD_SAMPLES):
+        self.directory = directory
+        self.size = size
+        self.shard_samples = shard_samples
+        self.prefix = "s{}-{}".format(size, uuid.uuid4().hex[:12])
+        self.shards = []
+        self.shard = None
+        self.count = 0
+
+    def _new_shard(self):
+        self.close_shard()
+        filename = "{}-{:04d}.npy".format(self.prefix, len(self.shards))
+        self.shard = np.lib.format.open_memmap(
+            os.path.join(self.directory, filename), mode='w+',
+            dtype=sample_dtype(self.size), shape=(self.shard_samples,))
+        self.shards.append({'file': filename, 'size': self.size,
+                            'count': 0})
+        self.count = 0
+
+    def add_game(self, boards, to_move, moves, winner):
+        """
+        Adds the positions of a finished game.
+
+        Arguments:
+        - The boards, an array of shape (n, size, size).
+        - The player to move in each position.
+        - The move played in each position (row * size + column).
+        - The winner of the game.
+        """
+        packed = pack_boards(boards)
+        start = 0
+        while start < len(packed):
+            if self.shard is None or self.count == self.shard_samples:
+                self._new_shard()
+            end = min(len(packed), start + self.shard_samples - self.count)
+            records = self.shard[self.count:self.count + end - start]
+            records['board'] = packed[start:end]
+            records['to_move'] = to_move[start:end]
+            records['winner'] = winner
+            records['move'] = moves[start:end]
+            self.count += end - start
+            self.shards[-1]['count'] = self.count
+            start = end
+
+    def close_shard(self):
+        """Flushes the current shard to the disk."""
+        if self.shard is not None:
+            self.shard.flush()
+            self.shard = None
+
+    def close(self):
+        """Flushes the shards, returns their index entries."""
+        self.close_shard()
+        return self.shards
+
+
+def read_index(directory):
+    """Returns the index entries of a data directory."""
+    path = os.path.join(directory, INDEX_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path) as index_file:
+        return json.load(index_file)
+
+
+def write_index(directory, shards):
+    """Writes the index of a data directory."""
+    path = os.path.join(directory, INDEX_FILE)
+    with open(path + '.tmp', 'w') as index_file:
+        json.dump(shards, index_file, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+class ShardReader():
+    """
+    The ShardReader class samples random positions of a board size
+    from the shards of a data directory. Shards are memory-mapped, so
+    only the sampled records are read from the disk.
+    """
+
+    def __init__(self, directory, size):
+        self.size = size
+        self.entries = [entry for entry in read_index(directory)
+                        if entry['size'] == size and entry['count']]
+        self.shards = [np.load(os.path.join(directory, entry['file']),
+                               mmap_mode='r')
+                       for entry in self.entries]
+        self.counts = np.array([entry['count'] for entry in self.entries])
+
+    def __len__(self):
+        return int(self.counts.sum())
+
+    def sample(self, number, rng=None):
+        """
+        Returns number random samples as a dictionary of arrays:
+        board (number, size, size), to_move, winner and move.
+        """
+        rng = rng or np.random.default_rng()
+        shard_ids = rng.choice(len(self.shards), size=number,
+                               p=self.counts / self.counts.sum())
+        records = np.empty(number, dtype=sample_dtype(self.size))
+        for shard_id in np.unique(shard_ids):
+            selected = np.flatnonzero(shard_ids == shard_id)
+            rows = np.sort(rng.integers(0, self.counts[shard_id],
+                                        size=len(selected)))
+            records[selected] = self.shards[shard_id][rows]
+        return {'board': unpack_boards(records['board'], self.size),
+                'to_move': records['to_move'],
+                'winner': records['winner'],
+                'move': records['move']}
+
+
+def load_player(spec):
+    """Creates a player from a module:Class specification."""
+    module_name, class_name = spec.split(':')
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+def copy_board(hexboard):
+    """Returns a copy of the board, given to the players."""
+    return hexgame.Hex.create_from_str(hexboard.serialize())
+
+
+def play_game(players, size):
+    """
+    Plays a game between the players (a dictionary color -> player).
+    Returns the boards, players to move and moves of each position,
+    and the winner.
+    """
+    hexboard = hexgame.Hex(size)
+    for color, player in players.items():
+        player.on_start(copy_board(hexboard), color)
+    boards, to_move, moves = [], [], []
+    while not hexboard.winner:
+        row, col = players[hexboard.current].choose_move(
+            copy_board(hexboard), None)
+        boards.append([cells[:] for cells in hexboard.grid])
+        to_move.append(hexboard.current)
+        moves.append(row * size + col)
+        hexboard.play(row, col)
+        if not hexboard.winner:
+            players[hexboard.current].on_opponent_move(copy_board(hexboard))
+    for player in players.values():
+        player.on_end(copy_board(hexboard))
+    return boards, to_move, moves, hexboard.winner
+
+
+def generate(job):
+    """Plays games in a worker process, returns the written shards."""
+    spec, size, games, directory, shard_samples, seed = job
+    np.random.seed(seed)
+    random.seed(seed)
+    players = {hexgame.BLUE: load_player(spec), hexgame.RED: load_player(spec)}
+    writer = ShardWriter(directory, size, shard_samples)
+    for _ in range(games):
+        boards, to_move, moves, winner = play_game(players, size)
+        writer.add_game(np.array(boards, dtype=np.uint8),
+                        np.array(to_move, dtype=np.uint8),
+                        np.array(moves, dtype=np.uint16), winner)
+    return writer.close()
+
+
+def main():
+    """Generates self-play games into a data directory."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('player', help='player class, as module:Class')
+    parser.add_argument('--size', default=11, type=int)
+    parser.add_argument('--games', default=100, type=int)
+    parser.add_argument('--workers', default=os.cpu_count(), type=int)
+    parser.add_argument('--output', default='selfplay')
+    parser.add_argument('--shard-samples', default=SHARD_SAMPLES, type=int)
+    parser.add_argument('--seed', default=None, type=int)
+    arguments = parser.parse_args(sys.argv[1:])
+
+    os.makedirs(arguments.output, exist_ok=True)
+    seeds = np.random.SeedSequence(arguments.seed).generate_state(
+        arguments.workers)
+    jobs = [(arguments.player, arguments.size,
+             arguments.games // arguments.workers
+             + (worker < arguments.games % arguments.workers),
+             arguments.output, arguments.shard_samples, int(seed))
+            for worker, seed in enumerate(seeds)]
+    shards = read_index(arguments.output)
+    with multiprocessing.Pool(arguments.workers) as pool:
+        for worker_shards in pool.imap_unordered(generate, jobs):
+            shards.extend(worker_shards)
+            write_index(arguments.output, shards)
+    print("{} samples in {} shards".format(
+        sum(shard['count'] for shard in shards), len(shards)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+
+"""
+This module solves small Hex boards (up to 6x6): it proves which
+player wins a position, and with which moves, by a depth-first search
+where the positions are identified by their canonical keys (see
+Hex.canonical_key), so that symmetric positions are solved once.
+
+The search stops at the first winning move of a position (a proof
+search), and only tries the moves which may prevent the winning
+replies already found (mustplay), so the table holds the positions of
+the proof. A 5x5 board is solved in about 30 seconds this way. The
+positions with less than --exhaustive-depth stones are searched
+exhaustively, so that the table also answers all the opening moves of
+both players (at a much higher cost). With --exhaustive, every move of
+every reachable position is searched, and the table holds all the
+reachable positions with all their winning moves (practical up to 4x4).
+
+The solutions are saved as a NumPy array of two rows: the sorted keys
+(the cells of the canonical position in base 3, 64 bits are enough up
+to 6x6), and the results (the bit mask of the winning moves in the
+canonical position, with the value in the highest bit). SolutionTable
+opens the file as a memory map and finds the positions by binary
+search. The player of solver_client.py plays from the table, and
+solves the positions missing from it.
+"""
+
+
+import argparse
+import collections
+import itertools
+import sys
+
+import numpy as np
+
+import hexgame
+
+
+MAX_SIZE = 6
+EXHAUSTIVE_DEPTH = 0
+BASE_3_DIGITS = bytes.maketrans(b'\x00\x01\x02', b'012')
+VALUE_BIT = 63
+
+
+def default_path(size):
+    """Returns the default file of the solutions of a board size."""
+    return 'solutions-{}.npy'.format(size)
+
+
+def table_key(key):
+    """Returns the 64-bit key of a canonical key (Blue to move)."""
+    return int(key[1:].translate(BASE_3_DIGITS), 3)
+
+
+class SearchLimit(Exception):
+    """This exception is raised when a search uses too many nodes."""
+    pass
+
+
+class Solver():
+    """
+    The Solver class solves the positions of a board size. The
+    results are stored by 64-bit key: (True if the player to move wins,
+    bit mask of the winning moves, carrier of the proof), the masks
+    being those of the canonical position. The positions found in the
+    optional solution table are not searched again.
+    """
+
+    def __init__(self, size, exhaustive_depth=0, max_nodes=None,
+                 table=None):
+        if size > MAX_SIZE:
+            raise ValueError("Boards larger than {0}x{0} are not supported"
+                             .format(MAX_SIZE))
+        self.hexboard = hexgame.Hex(size)
+        self.exhaustive_depth = exhaustive_depth
+        self.max_nodes = max_nodes
+        self.table = table
+        self.nodes = 0
+        self.results = {}
+        # Ties between moves are broken in favor of the cells which won
+        # most often (history), then of the central cells
+        center = (size - 1) / 2
+        self.order = sorted(range(size * size), key=lambda cell: (
+            abs(cell // size - center) + abs(cell % size - center), cell))
+        self.history = [0] * (size * size)
+        self.neighbours = [[k for k in self.hexboard.edges[cell]
+                            if k < size * size]
+                           for cell in range(size * size)]
+        # The edges touched by each cell: 1 for the first row (Red) or
+        # column (Blue), 2 for the last one
+        self.edge_flags = {
+            player: [(position == 0) | (position == size - 1) << 1
+                     for position in (divmod(cell, size)[axis]
+                                      for cell in range(size * size))]
+            for player, axis in ((hexgame.BLUE, 1), (hexgame.RED, 0))}
+
+    def _winning_cells(self, cells, player):
+        """Returns the empty cells where player would win at once."""
+        edge_flags = self.edge_flags[player]
+        groups, flags = [None] * len(cells), []
+        for start, color in enumerate(cells):
+            if color != player or groups[start] is not None:
+                continue
+            groups[start], stack, group_flags = len(flags), [start], 0
+            while stack:
+                cell = stack.pop()
+                group_flags |= edge_flags[cell]
+                for neighbour in self.neighbours[cell]:
+                    if cells[neighbour] == player \
+                            and groups[neighbour] is None:
+                        groups[neighbour] = len(flags)
+                        stack.append(neighbour)
+            flags.append(group_flags)
+        winning = []
+        for cell, color in enumerate(cells):
+            if color == hexgame.EMPTY:
+                cell_flags = edge_flags[cell]
+                for neighbour in self.neighbours[cell]:
+                    if groups[neighbour] is not None:
+                        cell_flags |= flags[groups[neighbour]]
+                if cell_flags == 3:
+                    winning.append(cell)
+        return winning
+
+    def _edge_distances(self, cells, player, edge):
+        """
+        Returns the number of empty cells to fill, for player, to link
+        each cell to one of its edges (1: first, 2: last), by a 0-1 BFS.
+        """
+        size = self.hexboard.size
+        cost = [0 if color == player else 1 if color == hexgame.EMPTY
+                else None for color in cells]
+        distances = [size * size] * (size * size)
+        queue = collections.deque()
+        for cell, flags in enumerate(self.edge_flags[player]):
+            if flags & edge and cost[cell] is not None:
+                distances[cell] = cost[cell]
+                queue.append(cell)
+        while queue:
+            cell = queue.popleft()
+            for neighbour in self.neighbours[cell]:
+                step = cost[neighbour]
+                if (step is not None
+                        and distances[cell] + step < distances[neighbour]):
+                    distances[neighbour] = distances[cell] + step
+                    if step:
+                        queue.append(neighbour)
+                    else:
+                        queue.appendleft(neighbour)
+        return distances
+
+    def _ordered(self, cells, empty):
+        """
+        Sorts the empty cells by the lengths of the shortest links of
+        both players through them: the cells on both shortest links
+        come first.
+        """
+        scores = [0] * len(cells)
+        for player in (hexgame.BLUE, hexgame.RED):
+            for edge in (1, 2):
+                for cell, distance in enumerate(
+                        self._edge_distances(cells, player, edge)):
+                    scores[cell] += distance
+        return sorted(empty, key=lambda cell: (scores[cell],
+                                               -self.history[cell]))
+
+    def _transform_mask(self, transform, mask):
+        """Applies a symmetry to a bit mask of cells."""
+        size = self.hexboard.size
+        result = 0
+        for cell in range(size * size):
+            if mask >> cell & 1:
+                i, j = self.hexboard.transform_move(transform,
+                                                    *divmod(cell, size))
+                result |= 1 << (i * size + j)
+        return result
+
+    def solve(self):
+        """
+        Solves the position of self.hexboard. Returns True if the
+        player to move wins, the winning moves as a bit mask of the
+        cells of the canonical position, and the carrier of the proof:
+        the bit mask of the empty cells it depends on. The result holds
+        whatever the other empty cells contain.
+        """
+        hexboard = self.hexboard
+        key, transform = hexboard.canonical_key()
+        key = table_key(key)
+        result = self.results.get(key)
+        if result is not None:
+            wins, moves, carrier = result
+            return wins, moves, self._transform_mask(transform, carrier)
+        cells = list(itertools.chain.from_iterable(hexboard.grid))
+        empty = [cell for cell in self.order if cells[cell] == hexgame.EMPTY]
+        solution = self.table.find(key) if self.table is not None else None
+        if solution is not None:
+            # The table has no carriers: all the empty cells are one
+            return solution + (sum(1 << cell for cell in empty),)
+        self.nodes += 1
+        if self.max_nodes and self.nodes > self.max_nodes:
+            raise SearchLimit()
+
+        size, player = hexboard.size, hexboard.current
+        opponent = hexgame.RED if player == hexgame.BLUE else hexgame.BLUE
+        exhaustive = len(cells) - len(empty) < self.exhaustive_depth
+        wins_at_once = self._winning_cells(cells, player)
+        winning, win_carrier, loss_carrier = 0, 0, 0
+        for cell in wins_at_once:
+            winning |= 1 << cell
+            win_carrier = win_carrier or 1 << cell
+        if exhaustive:
+            candidates = self._ordered(cells, empty)
+        elif wins_at_once:
+            candidates = []
+        else:
+            # The player must block the cells where the opponent would
+            # win at once: with two of them, the position is lost
+            threats = self._winning_cells(cells, opponent)[:2]
+            for cell in threats:
+                loss_carrier |= 1 << cell
+            candidates = threats if len(threats) == 1 else [] if threats \
+                else self._ordered(cells, empty)
+
+        # The moves out of the carrier of a winning reply of the
+        # opponent lose too (mustplay): a stone there is no better than
+        # the stone of the refuted move
+        mustplay = -1
+        for cell in candidates:
+            if cell in wins_at_once or not mustplay >> cell & 1:
+                continue
+            i, j = divmod(cell, size)
+            hexboard.grid[i][j] = player
+            hexboard.current = opponent
+            try:
+                opponent_wins, _, carrier = self.solve()
+            finally:
+                hexboard.grid[i][j] = hexgame.EMPTY
+                hexboard.current = player
+            if opponent_wins:
+                if not exhaustive:
+                    mustplay &= carrier
+                loss_carrier |= carrier | 1 << cell
+            else:
+                self.history[cell] += 1
+                winning |= 1 << cell
+                win_carrier = win_carrier or carrier | 1 << cell
+                if not exhaustive:
+                    break
+
+        result = (bool(winning), self._transform_mask(transform, winning),
+                  win_carrier if winning else loss_carrier)
+        self.results[key] = result[:2] + (
+            self._transform_mask(transform, result[2]),)
+        return result
+
+    def save(self, path):
+        """Saves the solved positions, sorted by key."""
+        keys = np.array(list(self.results), dtype=np.uint64)
+        results = np.array([moves | value << VALUE_BIT for value, moves, _
+                            in self.results.values()], dtype=np.uint64)
+        order = np.argsort(keys)
+        np.save(path, np.stack([keys[order], results[order]]))
+
+
+class SolutionTable():
+    """
+    The SolutionTable class looks positions up in a solution file,
+    opened as a memory map.
+    """
+
+    def __init__(self, path):
+        table = np.load(path, mmap_mode='r')
+        # Both rows are contiguous, as searchsorted needs
+        self.keys, self.results = table[0], table[1]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def find(self, key):
+        """
+        Returns (True if the player to move wins, bit mask of the
+        winning moves in the canonical position) for a 64-bit key, or
+        None if the position is not in the table.
+        """
+        # A NumPy integer, not to be compared as a float
+        key = np.uint64(key)
+        index = int(np.searchsorted(self.keys, key))
+        if index == len(self.keys) or self.keys[index] != key:
+            return None
+        result = int(self.results[index])
+        return bool(result >> VALUE_BIT), result & ((1 << VALUE_BIT) - 1)
+
+    def lookup(self, hexboard):
+        """
+        Returns (True if the player to move wins, list of its winning
+        moves), or None if the position is not in the table.
+        """
+        key, transform = hexboard.canonical_key()
+        solution = self.find(table_key(key))
+        if solution is None:
+            return None
+        size = hexboard.size
+        return solution[0], [
+            hexboard.transform_move(transform, *divmod(cell, size))
+            for cell in range(size * size) if solution[1] >> cell & 1]
+
+
+def main():
+    """Solves a board size, saves the solutions."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('size', type=int)
+    parser.add_argument('--exhaustive-depth', default=EXHAUSTIVE_DEPTH,
+                        type=int, help='search all the moves of the '
+                        'positions with less stones')
+    parser.add_argument('--exhaustive', action='store_true',
+                        help='search all the moves of all the positions')
+    parser.add_argument('--output', default=None)
+    arguments = parser.parse_args(sys.argv[1:])
+    if arguments.size > MAX_SIZE:
+        parser.error('boards larger than {0}x{0} are not supported'
+                     .format(MAX_SIZE))
+    sys.setrecursionlimit(max(1000, 4 * arguments.size ** 2))
+    solver = Solver(arguments.size, arguments.size ** 2 + 1
+                    if arguments.exhaustive else arguments.exhaustive_depth)
+    first_player_wins = solver.solve()[0]
+    solver.save(arguments.output or default_path(arguments.size))
+    print("{} wins the {}x{} board, {} positions solved".format(
+        hexgame.PLAYER_NAMES[hexgame.BLUE if first_player_wins
+                             else hexgame.RED],
+        arguments.size, arguments.size, len(solver.results)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+
+"""
+This module implements a client for the Hex board game playing
+perfectly on the small boards solved by solver.py.
+"""
+
+import hexclient
+import hexgame
+import solver
+
+
+class SolverPlayer(hexclient.Player):
+    """
+    A player looking its moves up in the solution table of the board
+    size, and solving the missing positions within a node budget. The
+    solver of each size is kept, with its results, from move to move.
+    """
+
+    def __init__(self, max_nodes=20000):
+        super().__init__()
+        self.max_nodes = max_nodes
+        self.tables = {}
+        self.solvers = {}
+
+    def _table(self, size):
+        if size not in self.tables:
+            try:
+                self.tables[size] = solver.SolutionTable(
+                    solver.default_path(size))
+            except (OSError, ValueError):
+                self.tables[size] = None
+        return self.tables[size]
+
+    def _solve(self, hexboard):
+        if hexboard.size > solver.MAX_SIZE:
+            return None
+        if hexboard.size not in self.solvers:
+            self.solvers[hexboard.size] = solver.Solver(
+                hexboard.size, max_nodes=self.max_nodes,
+                table=self._table(hexboard.size))
+        board_solver = self.solvers[hexboard.size]
+        board_solver.hexboard = hexgame.Hex.create_from_str(
+            hexboard.serialize())
+        board_solver.nodes = 0
+        try:
+            _, moves, _ = board_solver.solve()
+        except solver.SearchLimit:
+            return None
+        _, transform = hexboard.canonical_key()
+        return [hexboard.transform_move(transform, *divmod(cell,
+                                                           hexboard.size))
+                for cell in range(hexboard.size ** 2) if moves >> cell & 1]
+
+    def choose_move(self, hexboard, time_budget):
+        table = self._table(hexboard.size)
+        result = table.lookup(hexboard) if table is not None else None
+        moves = result[1] if result is not None else self._solve(hexboard)
+        if moves:
+            return moves[0]
+        # A lost (or unsolved) position: play the most central cell
+        center = (hexboard.size - 1) / 2
+        return min(((i, j) for i in range(hexboard.size)
+                    for j in range(hexboard.size)
+                    if hexboard.grid[i][j] == hexgame.EMPTY),
+                   key=lambda move: abs(move[0] - center)
+                   + abs(move[1] - center))
+
+
+def main():
+    """Runs the client."""
+    hexclient.main(SolverPlayer())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Tests of distances.py: the distance maps repaired from move to move,
+against the maps computed from scratch.
+"""
+
+import collections
+import random
+import unittest
+
+import distances
+import hexgame
+
+
+def board_of(engine):
+    """Returns a Hex board with the stones of the engine."""
+    size = engine.size
+    hexboard = hexgame.Hex(size)
+    hexboard.grid = [engine.grid[i * size:(i + 1) * size]
+                     for i in range(size)]
+    return hexboard
+
+
+def edge_distance(hexboard, player):
+    """
+    Returns the number of empty cells player must fill to link its
+    edges, by a 0-1 BFS over the cells (None if it is cut off).
+    """
+    size = hexboard.size
+    if player == hexgame.BLUE:
+        starts = [(i, 0) for i in range(size)]
+        goal = lambda i, j: j == size - 1
+    else:
+        starts = [(0, j) for j in range(size)]
+        goal = lambda i, j: i == size - 1
+    best = {}
+    queue = collections.deque()
+    for i, j in starts:
+        if hexboard.grid[i][j] != hexgame.EMPTY \
+                and hexboard.grid[i][j] != player:
+            continue
+        best[i, j] = int(hexboard.grid[i][j] == hexgame.EMPTY)
+        queue.append((best[i, j], i, j))
+    result = None
+    while queue:
+        distance, i, j = queue.popleft()
+        if distance > best[i, j]:
+            continue
+        if goal(i, j) and (result is None or distance < result):
+            result = distance
+        for k, l in ((i - 1, j), (i - 1, j + 1), (i, j + 1),
+                     (i + 1, j), (i + 1, j - 1), (i, j - 1)):
+            if not (0 <= k < size and 0 <= l < size):
+                continue
+            stone = hexboard.grid[k][l]
+            if stone != hexgame.EMPTY and stone != player:
+                continue
+            step = int(stone == hexgame.EMPTY)
+            if (k, l) not in best or distance + step < best[k, l]:
+                best[k, l] = distance + step
+                if step:
+                    queue.append((distance + step, k, l))
+                else:
+                    queue.appendleft((distance + step, k, l))
+    return result
+
+
+class DistanceEngineTest(unittest.TestCase):
+    """The incremental maps of random sequences of moves."""
+
+    def assert_scratch(self, engine):
+        """Checks the maps of the engine against a full computation."""
+        scratch = distances.DistanceEngine(engine.size)
+        scratch.reset(board_of(engine))
+        self.assertEqual(engine.maps, scratch.maps)
+        self.assertEqual(engine.costs, scratch.costs)
+
+    def test_place_matches_scratch(self):
+        rng = random.Random(0)
+        for size in (1, 2, 3, 5, 8, 11):
+            for _ in range(5):
+                engine = distances.DistanceEngine(size)
+                cells = [(i, j) for i in range(size) for j in range(size)]
+                rng.shuffle(cells)
+                for i, j in cells:
+                    engine.place(i, j, rng.choice((hexgame.BLUE,
+                                                   hexgame.RED)))
+                    self.assert_scratch(engine)
+
+    def test_remove_matches_scratch(self):
+        rng = random.Random(1)
+        for size in (2, 3, 5, 8):
+            engine = distances.DistanceEngine(size)
+            stones = []
+            for _ in range(4 * size * size):
+                empty = [cell for cell in range(size * size)
+                         if engine.grid[cell] == hexgame.EMPTY]
+                if stones and (not empty or rng.random() < 0.4):
+                    cell = stones.pop(rng.randrange(len(stones)))
+                    engine.remove(*divmod(cell, size))
+                else:
+                    cell = rng.choice(empty)
+                    engine.place(*divmod(cell, size),
+                                 rng.choice((hexgame.BLUE, hexgame.RED)))
+                    stones.append(cell)
+                self.assert_scratch(engine)
+
+    def test_distance_matches_bfs(self):
+        rng = random.Random(2)
+        for size in (1, 3, 4, 6, 9):
+            engine = distances.DistanceEngine(size)
+            hexboard = hexgame.Hex(size)
+            cells = [(i, j) for i in range(size) for j in range(size)]
+            rng.shuffle(cells)
+            for i, j in cells:
+                color = rng.choice((hexgame.BLUE, hexgame.RED))
+                hexboard.grid[i][j] = color
+                engine.place(i, j, color)
+                for player in (hexgame.BLUE, hexgame.RED):
+                    expected = edge_distance(hexboard, player)
+                    self.assertEqual(engine.distance(player),
+                                     distances.INF if expected is None
+                                     else expected)
+
+    def test_through(self):
+        engine = distances.DistanceEngine(3)
+        engine.place(1, 1, hexgame.RED)
+        # Blue goes around the center, Red is already half way
+        self.assertEqual(engine.through(hexgame.BLUE, 1, 1), distances.INF)
+        self.assertEqual(engine.through(hexgame.BLUE, 0, 0), 3)
+        self.assertEqual(engine.through(hexgame.RED, 1, 1), 2)
+        self.assertEqual(engine.through(hexgame.RED, 0, 1), 2)
+
+    def test_sync(self):
+        rng = random.Random(3)
+        size = 6
+        engine = distances.DistanceEngine(size)
+        hexboard = hexgame.Hex(size)
+        cells = [(i, j) for i in range(size) for j in range(size)]
+        rng.shuffle(cells)
+        for i, j in cells[:20]:
+            hexboard.play(i, j)
+            if rng.random() < 0.5:
+                engine.sync(hexboard)
+                self.assert_scratch(engine)
+        # A new game: the stones removed are taken into account
+        hexboard = hexgame.Hex(size)
+        hexboard.play(*cells[-1])
+        engine.sync(hexboard)
+        self.assertEqual(engine.grid, sum(hexboard.grid, []))
+        self.assert_scratch(engine)
+
+
+if __name__ == '__main__':
+    unittest.main()
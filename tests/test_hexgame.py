@@ -0,0 +1,102 @@
+"""
+Tests of hexgame.py: the canonical keys of the positions and their
+symmetries.
+"""
+
+import random
+import unittest
+
+import hexgame
+
+
+SWAPPED = {hexgame.EMPTY: hexgame.EMPTY, hexgame.BLUE: hexgame.RED,
+           hexgame.RED: hexgame.BLUE}
+
+
+def random_position(size, stones, rng):
+    """Returns a board with random stones and a random player to move."""
+    hexboard = hexgame.Hex(size)
+    cells = [(i, j) for i in range(size) for j in range(size)]
+    for i, j in rng.sample(cells, stones):
+        hexboard.grid[i][j] = rng.choice((hexgame.BLUE, hexgame.RED))
+    hexboard.current = rng.choice((hexgame.BLUE, hexgame.RED))
+    return hexboard
+
+
+def transformed(hexboard, transform):
+    """Returns the position given by a symmetry of canonical_key."""
+    swap = transform in (hexgame.SWAP, hexgame.SWAP_ROTATION)
+    result = hexgame.Hex(hexboard.size)
+    for i in range(hexboard.size):
+        for j in range(hexboard.size):
+            k, l = hexboard.transform_move(transform, i, j)
+            color = hexboard.grid[i][j]
+            result.grid[k][l] = SWAPPED[color] if swap else color
+    result.current = (SWAPPED[hexboard.current] if swap
+                      else hexboard.current)
+    return result
+
+
+class CanonicalKeyTest(unittest.TestCase):
+    """The keys of symmetric and distinct positions."""
+
+    def test_symmetric_positions_share_key(self):
+        rng = random.Random(0)
+        for size in (1, 2, 3, 4, 7):
+            for _ in range(20):
+                hexboard = random_position(size, rng.randint(0, size * size),
+                                           rng)
+                key = hexboard.canonical_key()[0]
+                for transform in range(4):
+                    self.assertEqual(
+                        transformed(hexboard, transform).canonical_key()[0],
+                        key)
+
+    def test_key_is_canonical_position(self):
+        rng = random.Random(1)
+        for size in (2, 3, 5, 6):
+            for _ in range(20):
+                hexboard = random_position(size, rng.randint(0, size * size),
+                                           rng)
+                key, transform = hexboard.canonical_key()
+                canonical = transformed(hexboard, transform)
+                self.assertEqual(canonical.current, hexgame.BLUE)
+                self.assertEqual(key, bytes(
+                    [canonical.current]
+                    + [cell for row in canonical.grid for cell in row]))
+
+    def test_transform_move_is_involution(self):
+        hexboard = hexgame.Hex(5)
+        for transform in range(4):
+            for i in range(5):
+                for j in range(5):
+                    self.assertEqual(hexboard.transform_move(
+                        transform,
+                        *hexboard.transform_move(transform, i, j)), (i, j))
+
+    def test_distinct_openings(self):
+        # The first moves of a 3x3 board, up to the 180° rotation
+        keys = set()
+        for i in range(3):
+            for j in range(3):
+                hexboard = hexgame.Hex(3)
+                hexboard.play(i, j)
+                keys.add(hexboard.canonical_key()[0])
+        self.assertEqual(len(keys), 5)
+
+    def test_canonical_moves_map_back(self):
+        # A stone found in the canonical position maps back to the board
+        rng = random.Random(2)
+        for _ in range(50):
+            hexboard = random_position(4, rng.randint(1, 16), rng)
+            _, transform = hexboard.canonical_key()
+            canonical = transformed(hexboard, transform)
+            for k in range(4):
+                for l in range(4):
+                    i, j = hexboard.transform_move(transform, k, l)
+                    self.assertEqual(hexboard.grid[i][j] == hexgame.EMPTY,
+                                     canonical.grid[k][l] == hexgame.EMPTY)
+
+
+if __name__ == '__main__':
+    unittest.main()
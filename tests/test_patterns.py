@@ -0,0 +1,86 @@
+"""
+Tests of patterns.py: the codes kept by PatternTracker from move to
+move, against the codes computed from scratch.
+"""
+
+import random
+import unittest
+
+import hexgame
+import patterns
+
+
+def random_moves(hexboard, rng):
+    """Yields random moves, played until the game is won."""
+    cells = [(i, j) for i in range(hexboard.size)
+             for j in range(hexboard.size)]
+    rng.shuffle(cells)
+    for move in cells:
+        if hexboard.winner:
+            break
+        yield move
+
+
+class PatternTrackerTest(unittest.TestCase):
+    """The incremental codes of random games."""
+
+    def test_codes_match_scratch(self):
+        rng = random.Random(0)
+        for size in (1, 2, 3, 5, 8):
+            for _ in range(5):
+                hexboard = hexgame.Hex(size)
+                tracker = patterns.PatternTracker(hexboard)
+                for i, j in random_moves(hexboard, rng):
+                    tracker.play(i, j)
+                    self.assertEqual(
+                        tracker.codes,
+                        patterns.PatternTracker(hexboard).codes)
+
+    def test_red_sees_swapped_transposed_board(self):
+        rng = random.Random(1)
+        size = 6
+        hexboard = hexgame.Hex(size)
+        tracker = patterns.PatternTracker(hexboard)
+        for i, j in list(random_moves(hexboard, rng))[:20]:
+            tracker.play(i, j)
+        transposed = [[patterns.SWAPPED[hexboard.grid[j][i]]
+                       for j in range(size)] for i in range(size)]
+        for i in range(size):
+            for j in range(size):
+                self.assertEqual(
+                    tracker.code(i, j, hexgame.BLUE),
+                    patterns.cell_code(hexboard.grid, size, i, j))
+                self.assertEqual(
+                    tracker.code(i, j, hexgame.RED),
+                    patterns.cell_code(transposed, size, j, i))
+
+    def test_off_board_cells_are_edges(self):
+        code = patterns.cell_code([[hexgame.EMPTY]], 1, 0, 0)
+        for digit, (d_i, d_j) in enumerate(patterns.OFFSETS):
+            color = code // 3 ** digit % 3
+            self.assertEqual(color, hexgame.BLUE if d_j else hexgame.RED)
+
+
+class PatternTableTest(unittest.TestCase):
+    """The urgencies of the pattern tables."""
+
+    def test_radius_1_fallback(self):
+        table = patterns.PatternTable(default=2.0)
+        code = patterns.RADIUS_1_CODES * 5 + 7
+        self.assertEqual(table.urgency(code), 2.0)
+        table.radius_2[code] = 3.0
+        self.assertEqual(table.urgency(code), 3.0)
+
+    def test_sample_move_is_empty(self):
+        rng = random.Random(2)
+        hexboard = hexgame.Hex(4)
+        tracker = patterns.PatternTracker(hexboard)
+        table = patterns.PatternTable()
+        while not hexboard.winner:
+            i, j = table.sample_move(tracker, rng)
+            self.assertEqual(hexboard.grid[i][j], hexgame.EMPTY)
+            tracker.play(i, j)
+
+
+if __name__ == '__main__':
+    unittest.main()
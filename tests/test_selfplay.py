@@ -0,0 +1,96 @@
+"""
+Tests of selfplay.py: random boards written to the shards of a data
+directory, and read back through its index.
+"""
+
+import random
+import tempfile
+import unittest
+
+import numpy as np
+
+import hexgame
+import selfplay
+
+
+def random_game(size, rng):
+    """
+    Returns random samples of a game: the boards, the players to move,
+    the moves and a winner, as given to ShardWriter.add_game.
+    """
+    length = rng.randint(1, size * size)
+    boards = np.array([[[rng.choice((hexgame.EMPTY, hexgame.BLUE,
+                                     hexgame.RED))
+                         for _ in range(size)] for _ in range(size)]
+                       for _ in range(length)], dtype=np.uint8)
+    to_move = np.array([rng.choice((hexgame.BLUE, hexgame.RED))
+                        for _ in range(length)], dtype=np.uint8)
+    moves = np.array([rng.randrange(size * size) for _ in range(length)],
+                     dtype=np.uint16)
+    return boards, to_move, moves, rng.choice((hexgame.BLUE, hexgame.RED))
+
+
+def write_games(directory, size, games, shard_samples, rng):
+    """
+    Writes random games to the directory, returns their samples as
+    tuples (board bytes, to_move, winner, move) and the index entries.
+    """
+    writer = selfplay.ShardWriter(directory, size, shard_samples)
+    samples = []
+    for _ in range(games):
+        boards, to_move, moves, winner = random_game(size, rng)
+        writer.add_game(boards, to_move, moves, winner)
+        samples.extend((board.tobytes(), player, winner, move)
+                       for board, player, move in zip(boards, to_move,
+                                                      moves))
+    return samples, writer.close()
+
+
+class PackTest(unittest.TestCase):
+    """The boards packed on 2 bits per cell."""
+
+    def test_round_trip(self):
+        rng = np.random.default_rng(0)
+        for size in (1, 2, 3, 5, 8, 11):
+            boards = rng.integers(0, 3, size=(10, size, size), dtype=np.uint8)
+            packed = selfplay.pack_boards(boards)
+            self.assertEqual(packed.shape, (10, (size * size + 3) // 4))
+            np.testing.assert_array_equal(
+                selfplay.unpack_boards(packed, size), boards)
+
+
+class ShardTest(unittest.TestCase):
+    """The shards written by ShardWriter, read by ShardReader."""
+
+    def test_round_trip(self):
+        rng = random.Random(1)
+        with tempfile.TemporaryDirectory() as directory:
+            # Shards smaller than the games, and another board size
+            samples, shards = write_games(directory, 5, 6, 7, rng)
+            _, other_shards = write_games(directory, 4, 2, 7, rng)
+            selfplay.write_index(directory, shards + other_shards)
+            self.assertGreater(len(shards), 1)
+
+            reader = selfplay.ShardReader(directory, 5)
+            self.assertEqual(len(reader), len(samples))
+            # All the shards, in the order of the index
+            read = []
+            for shard, count in zip(reader.shards, reader.counts):
+                boards = selfplay.unpack_boards(shard['board'][:count], 5)
+                read.extend((board.tobytes(), record['to_move'],
+                             record['winner'], record['move'])
+                            for board, record in zip(boards, shard[:count]))
+            self.assertEqual(read, samples)
+            # Random samples
+            batch = reader.sample(200, np.random.default_rng(2))
+            self.assertEqual(batch['board'].shape, (200, 5, 5))
+            for board, player, winner, move in zip(
+                    batch['board'], batch['to_move'], batch['winner'],
+                    batch['move']):
+                self.assertIn((board.tobytes(), player, winner, move),
+                              samples)
+            del reader, shard
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+"""
+Tests of hexgame_server.py sessions, with the server in a subprocess
+and raw socket clients.
+"""
+
+from subprocess import Popen, DEVNULL
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+import hexgame
+
+
+SERVER_PATH = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'hexgame_server.py')
+
+
+def free_port():
+    """Returns a TCP port which is free (for now)."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def connect(port, timeout=10):
+    """Connects to the server, waiting for it to start."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return socket.create_connection(('127.0.0.1', port))
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.01)
+
+
+def client(sock, delay, sent, received):
+    """
+    Plays the first empty cell of each Play message. The first move is
+    sent after delay seconds, the others at once.
+
+    Arguments:
+    - The socket connected to the server.
+    - The delay of the first move.
+    - The list where the (Play identifier, move) pairs are appended.
+    - The list where the messages received are appended.
+    """
+    with sock, sock.makefile('rwb') as stream:
+        for line in stream:
+            fields = line.decode().split()
+            received.append(fields[0])
+            if fields[0] != 'Play':
+                continue
+            hexboard = hexgame.Hex.create_from_str(fields[1])
+            move = next((i, j) for i in range(hexboard.size)
+                        for j in range(hexboard.size)
+                        if hexboard.grid[i][j] == hexgame.EMPTY)
+            if delay:
+                time.sleep(delay)
+                delay = 0
+            sent.append((fields[2], list(move)))
+            stream.write("{}#{} {}\n".format(move[0], move[1],
+                                             fields[2]).encode())
+            stream.flush()
+
+
+class SessionTest(unittest.TestCase):
+    """Timed sessions of two games between a slow and a fast client."""
+
+    def test_late_move_after_timeout(self):
+        with tempfile.TemporaryDirectory() as directory:
+            record = os.path.join(directory, 'games.jsonl')
+            port = free_port()
+            command = [sys.executable, SERVER_PATH, '3', '--port', str(port),
+                       '--games', '2', '--time', '1', '--record', record]
+            with Popen(command, stdout=DEVNULL, stderr=DEVNULL) as server:
+                sent, received = [[], []], [[], []]
+                try:
+                    # The first client answers its first Play too late
+                    threads = [threading.Thread(
+                        target=client,
+                        args=(connect(port), delay, sent[index],
+                              received[index]), daemon=True)
+                               for index, delay in enumerate((1.5, 0))]
+                    for thread in threads:
+                        thread.start()
+                    server.wait(30)
+                finally:
+                    if server.poll() is None:
+                        server.kill()
+            with open(record) as record_file:
+                games = [json.loads(line) for line in record_file]
+
+        self.assertEqual(len(games), 2)
+        self.assertEqual([game['game'] for game in games], [1, 2])
+        self.assertEqual(games[0]['reason'], 'time')
+        self.assertNotEqual(games[1]['reason'], 'time')
+        self.assertNotIn('InvalidMove', received[0] + received[1])
+        # The moves of the second game answer its own Play messages
+        second_game = sorted(
+            (int(play_id.split('.')[1]), move)
+            for moves in sent for play_id, move in moves
+            if play_id.startswith('2.'))
+        self.assertEqual(games[1]['moves'],
+                         [move for _, move in second_game])
+        self.assertEqual(len(games[1]['players']), 2)
+
+
+class SpectatorTest(unittest.TestCase):
+    """A spectator watching a session of one game."""
+
+    def test_final_frames_arrive(self):
+        with tempfile.TemporaryDirectory() as directory:
+            record = os.path.join(directory, 'games.jsonl')
+            port, spectator_port = free_port(), free_port()
+            command = [sys.executable, SERVER_PATH, '3', '--port', str(port),
+                       '--spectator-port', str(spectator_port),
+                       '--record', record]
+            with Popen(command, stdout=DEVNULL, stderr=DEVNULL) as server:
+                try:
+                    spectator = connect(spectator_port)
+                    with spectator, spectator.makefile('rwb') as stream:
+                        stream.write(b"Watch all\n")
+                        stream.flush()
+                        # The spectator is subscribed before the game starts
+                        time.sleep(0.2)
+                        for _ in range(2):
+                            threading.Thread(
+                                target=client,
+                                args=(connect(port), 0, [], []),
+                                daemon=True).start()
+                        # Read until the server closes the connection
+                        lines = [line.decode().split() for line in stream]
+                    server.wait(30)
+                finally:
+                    if server.poll() is None:
+                        server.kill()
+            with open(record) as record_file:
+                game = json.loads(record_file.readline())
+
+        boards = [fields for fields in lines if fields[0] == 'Board']
+        self.assertEqual(lines[-1][:2], ['End', '1'])
+        self.assertEqual(boards[-1][1:], lines[-1][1:])
+        hexboard = hexgame.Hex.create_from_str(lines[-1][2])
+        self.assertEqual(hexboard.winner, game['winner'])
+        self.assertEqual(sum(cell != hexgame.EMPTY for row in hexboard.grid
+                             for cell in row), len(game['moves']))
+
+
+if __name__ == '__main__':
+    unittest.main()
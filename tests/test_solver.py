@@ -0,0 +1,185 @@
+"""
+Tests of solver.py: the solved positions, against a brute-force
+minimax written independently of the solver.
+"""
+
+import os
+import tempfile
+import unittest
+
+import hexgame
+import solver
+
+
+class BruteForce():
+    """
+    A memoized minimax over all the moves, on bit boards (bit i * size
+    + j for the cell (i, j)). Only the rules of the game prune it: a
+    player wins at once when possible, and must otherwise block the
+    cell where the opponent would win at once (and loses on two such
+    cells). The positions are stored up to the 180 degrees rotation.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        full = (1 << size * size) - 1
+        first_column = sum(1 << i * size for i in range(size))
+        self.not_first_column = full & ~first_column
+        self.not_last_column = full & ~(first_column << size - 1)
+        first_row = (1 << size) - 1
+        # Blue links the left and right edges, Red the top and bottom
+        self.edges = {
+            hexgame.BLUE: (first_column, first_column << size - 1),
+            hexgame.RED: (first_row, first_row << size * (size - 1))}
+        self.digits = '{{:0{}b}}'.format(size * size)
+        # The central cells first: the winning moves are found sooner
+        center = (size - 1) / 2
+        self.order = sorted(range(size * size), key=lambda cell: (
+            abs(cell // size - center) + abs(cell % size - center)))
+        self.values = {}
+
+    def connected(self, stones, player):
+        """Tells whether the stones of player link its two edges."""
+        size = self.size
+        start, goal = self.edges[player]
+        reached = frontier = stones & start
+        while frontier:
+            # The neighbours (i, j -+ 1), (i -+ 1, j), (i +- 1, j -+ 1)
+            grown = (frontier << 1 & self.not_first_column
+                     | frontier >> 1 & self.not_last_column
+                     | frontier << size | frontier >> size
+                     | frontier << size - 1 & self.not_last_column
+                     | frontier >> size - 1 & self.not_first_column)
+            frontier = grown & stones & ~reached
+            reached |= frontier
+        return bool(reached & goal)
+
+    def wins_after(self, own, other, player, cell):
+        """Tells whether the move of player on cell wins the game."""
+        own |= 1 << cell
+        opponent = hexgame.RED if player == hexgame.BLUE else hexgame.BLUE
+        return self.connected(own, player) \
+            or not self.wins(other, own, opponent)
+
+    def wins(self, own, other, player):
+        """Tells whether the player to move (with the own stones) wins."""
+        rotated = (int(self.digits.format(own)[::-1], 2),
+                   int(self.digits.format(other)[::-1], 2))
+        key = min((own, other), rotated) + (player,)
+        if key not in self.values:
+            opponent = (hexgame.RED if player == hexgame.BLUE
+                        else hexgame.BLUE)
+            empty = [cell for cell in self.order
+                     if not (own | other) >> cell & 1]
+            if any(self.connected(own | 1 << cell, player)
+                   for cell in empty):
+                value = True
+            else:
+                threats = [cell for cell in empty
+                           if self.connected(other | 1 << cell, opponent)]
+                value = len(threats) < 2 and any(
+                    not self.wins(other, own | 1 << cell, opponent)
+                    for cell in threats or empty)
+            self.values[key] = value
+        return self.values[key]
+
+    def winning_moves(self, own, other, player):
+        """Returns the bit mask of all the winning moves."""
+        return sum(1 << cell for cell in range(self.size ** 2)
+                   if not (own | other) >> cell & 1
+                   and self.wins_after(own, other, player, cell))
+
+
+def stones(cells, color):
+    """Returns the bit board of the stones of a color."""
+    return sum(1 << cell for cell, stone in enumerate(cells)
+               if stone == color)
+
+
+def solved_positions(board_solver):
+    """
+    Yields the canonical positions solved (cells, Blue to move), with
+    their value and winning moves.
+    """
+    cells_count = board_solver.hexboard.size ** 2
+    for key, (wins, moves, _) in board_solver.results.items():
+        cells = []
+        for _ in range(cells_count):
+            key, digit = divmod(key, 3)
+            cells.append(digit)
+        yield tuple(reversed(cells)), wins, moves
+
+
+class SolverTest(unittest.TestCase):
+    """The results of the solver on the small boards."""
+
+    def check(self, size, exhaustive_depth, complete):
+        """
+        Solves a board size, checks every solved position against the
+        brute force. The winning moves are all of them when complete,
+        otherwise a non-empty set of winning moves for the won positions.
+        """
+        board_solver = solver.Solver(size, exhaustive_depth)
+        first_player_wins = board_solver.solve()[0]
+        # The first player wins on every board size
+        self.assertTrue(first_player_wins)
+        brute_force = BruteForce(size)
+        positions = 0
+        for cells, wins, moves in solved_positions(board_solver):
+            positions += 1
+            blue, red = stones(cells, hexgame.BLUE), stones(cells, hexgame.RED)
+            self.assertEqual(wins, brute_force.wins(blue, red, hexgame.BLUE))
+            if complete:
+                self.assertEqual(moves, brute_force.winning_moves(
+                    blue, red, hexgame.BLUE))
+            else:
+                self.assertEqual(bool(moves), wins)
+                for cell in range(size * size):
+                    if moves >> cell & 1:
+                        self.assertTrue(brute_force.wins_after(
+                            blue, red, hexgame.BLUE, cell))
+        self.assertGreater(positions, 0)
+        return board_solver
+
+    def test_3x3_proof(self):
+        self.check(3, 0, complete=False)
+
+    def test_3x3_exhaustive(self):
+        board_solver = self.check(3, 3 * 3 + 1, complete=True)
+        # The winning first moves: the short diagonal, (0, 1) and (2, 1)
+        _, moves, _ = board_solver.solve()
+        self.assertEqual(moves, sum(1 << cell for cell in (1, 2, 4, 6, 7)))
+
+    def test_4x4_proof(self):
+        self.check(4, 0, complete=False)
+
+    def test_table_lookup(self):
+        board_solver = solver.Solver(3, 3 * 3 + 1)
+        board_solver.solve()
+        brute_force = BruteForce(3)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'solutions-3.npy')
+            board_solver.save(path)
+            table = solver.SolutionTable(path)
+            self.assertEqual(len(table), len(board_solver.results))
+            # The openings, with Red to move: not canonical positions
+            for i in range(3):
+                for j in range(3):
+                    hexboard = hexgame.Hex(3)
+                    hexboard.play(i, j)
+                    cells = tuple(cell for row in hexboard.grid
+                                  for cell in row)
+                    red, blue = stones(cells, hexgame.RED), \
+                        stones(cells, hexgame.BLUE)
+                    wins, moves = table.lookup(hexboard)
+                    self.assertEqual(wins,
+                                     brute_force.wins(red, blue, hexgame.RED))
+                    self.assertEqual(
+                        sum(1 << (k * 3 + l) for k, l in moves),
+                        brute_force.winning_moves(red, blue, hexgame.RED))
+            self.assertIsNone(table.find(3 ** 9))
+            del table
+
+
+if __name__ == '__main__':
+    unittest.main()
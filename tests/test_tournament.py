@@ -0,0 +1,62 @@
+"""
+Tests of tournament.py: the ratings and the pairings replayed from a
+results file, when a tournament is resumed.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import unittest
+
+import tournament
+
+
+def write_results(path, results):
+    """Writes match results as the Tournament class appends them."""
+    with open(path, 'w') as results_file:
+        for result in results:
+            results_file.write(json.dumps(result) + "\n")
+
+
+class ResumeTest(unittest.TestCase):
+    """Tournaments resumed from a results file."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'results.jsonl')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_replayed_ratings(self):
+        results = [{'id': tournament.match_id(0, 5, 'a', 'b'), 'round': 0,
+                    'size': 5, 'bots': ['a', 'b'], 'games': [0, 0]}]
+        write_results(self.path, results)
+        resumed = tournament.Tournament(['a', 'b'], self.path)
+        self.assertEqual(resumed.scores, {'a': 2, 'b': 0})
+        self.assertGreater(resumed.elo.ratings['a'], tournament.INITIAL_RATING)
+        self.assertEqual(set(resumed.results), {results[0]['id']})
+
+    def test_changed_roster(self):
+        results = [
+            {'id': tournament.match_id(1, 5, 'a', 'b'), 'round': 1,
+             'size': 5, 'bots': ['a', 'b'], 'games': [0, 1]},
+            {'id': tournament.match_id(1, 5, 'c', 'd'), 'round': 1,
+             'size': 5, 'bots': ['c', 'd'], 'games': [1, 1]}]
+        write_results(self.path, results)
+        # The client d left the roster
+        with self.assertLogs(level=logging.WARNING) as logs:
+            resumed = tournament.Tournament(['a', 'b', 'c'], self.path)
+        self.assertIn('d', logs.output[0])
+        self.assertEqual(set(resumed.results), {results[0]['id']})
+        self.assertEqual(resumed.scores, {'a': 1, 'b': 1, 'c': 0})
+        self.assertEqual(resumed.elo.ratings['c'], tournament.INITIAL_RATING)
+        # The next Swiss round is paired from the known matches only
+        matches = tournament.swiss_round(resumed, [5], 2)
+        self.assertEqual(len(matches), 1)
+        self.assertNotIn('d', matches[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
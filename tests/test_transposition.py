@@ -0,0 +1,191 @@
+"""
+Tests of transposition.py: the shared table, and the search using it
+against a plain negamax.
+"""
+
+import pickle
+import random
+import unittest
+
+import distances
+import hexgame
+import transposition
+
+
+def negamax(hexboard, depth):
+    """
+    Returns the score of a position by a negamax over all the moves,
+    with the leaves evaluated as by the Searcher, from scratch.
+    """
+    player = hexboard.current
+    adversary = hexgame.RED if player == hexgame.BLUE else hexgame.BLUE
+    engine = distances.DistanceEngine(hexboard.size)
+    engine.reset(hexboard)
+    own, other = engine.distance(player), engine.distance(adversary)
+    if other == 0:
+        return -transposition.WIN
+    if own == 0:
+        return transposition.WIN
+    if depth == 0:
+        return max(-transposition.WIN + 1, min(transposition.WIN - 1,
+                                               (other - own)
+                                               * transposition.SCALE))
+    best = -transposition.WIN - 1
+    for i in range(hexboard.size):
+        for j in range(hexboard.size):
+            if hexboard.grid[i][j] == hexgame.EMPTY:
+                hexboard.grid[i][j] = player
+                hexboard.current = adversary
+                best = max(best, -negamax(hexboard, depth - 1))
+                hexboard.grid[i][j] = hexgame.EMPTY
+                hexboard.current = player
+    return best
+
+
+def random_position(size, stones, rng):
+    """Returns a board after random moves, without a winner."""
+    while True:
+        hexboard = hexgame.Hex(size)
+        cells = [(i, j) for i in range(size) for j in range(size)]
+        for i, j in rng.sample(cells, stones):
+            hexboard.play(i, j)
+        if not hexboard.winner:
+            return hexboard
+
+
+class TranspositionTableTest(unittest.TestCase):
+    """Store and probe, in a small table."""
+
+    def setUp(self):
+        # 4 buckets of 2 entries
+        self.table = transposition.TranspositionTable.create(8)
+
+    def tearDown(self):
+        self.table.close()
+
+    def test_pack(self):
+        for entry in ((0, transposition.EXACT, 0, 0),
+                      (255, transposition.UPPER, -32768, 0xFFFE),
+                      (7, transposition.LOWER, 32767, transposition.NO_MOVE),
+                      (3, transposition.EXACT, -transposition.WIN, 12)):
+            self.assertEqual(transposition.unpack(transposition.pack(
+                *entry)), transposition.Entry(*entry))
+
+    def test_store_probe(self):
+        key = 0x123456789ABCDEF0
+        self.assertIsNone(self.table.probe(key))
+        self.table.store(key, 3, transposition.LOWER, -250, 17)
+        self.assertEqual(self.table.probe(key),
+                         transposition.Entry(3, transposition.LOWER, -250, 17))
+        # Same bucket, another key
+        self.assertIsNone(self.table.probe(key ^ 1 << 40))
+        self.assertEqual((self.table.hits, self.table.probes), (1, 3))
+
+    def test_replacement(self):
+        # Three keys of the same bucket
+        deep, recent, newer = (k << 8 | 1 for k in (1, 2, 3))
+        self.table.store(deep, 5, transposition.EXACT, 1)
+        self.table.store(recent, 3, transposition.EXACT, 2)
+        self.assertEqual(self.table.probe(deep).score, 1)
+        self.assertEqual(self.table.probe(recent).score, 2)
+        # The shallower result replaces the most recent one only
+        self.table.store(newer, 1, transposition.EXACT, 3)
+        self.assertEqual(self.table.probe(deep).score, 1)
+        self.assertIsNone(self.table.probe(recent))
+        self.assertEqual(self.table.probe(newer).score, 3)
+        # A shallower result of a key does not replace its deeper one
+        self.table.store(deep, 2, transposition.EXACT, 4)
+        self.assertEqual(self.table.probe(deep),
+                         transposition.Entry(5, transposition.EXACT, 1,
+                                             transposition.NO_MOVE))
+        self.assertIsNone(self.table.probe(newer))
+        # A deeper one does
+        self.table.store(deep, 6, transposition.LOWER, 5)
+        self.assertEqual(self.table.probe(deep),
+                         transposition.Entry(6, transposition.LOWER, 5,
+                                             transposition.NO_MOVE))
+
+    def test_torn_record(self):
+        key = 0xCAFE
+        self.table.store(key, 4, transposition.EXACT, 100, 3)
+        slot = (key & self.table.mask) * transposition.BUCKET_WORDS
+        # The record of another write, without its key
+        self.table.words[slot + 1] = transposition.pack(
+            6, transposition.LOWER, -100, 5)
+        self.assertIsNone(self.table.probe(key))
+
+    def test_clear(self):
+        self.table.store(42, 1, transposition.EXACT, 0)
+        self.table.clear()
+        self.assertIsNone(self.table.probe(42))
+
+    def test_pickled_table_shares_memory(self):
+        attached = pickle.loads(pickle.dumps(self.table))
+        try:
+            attached.store(99, 2, transposition.UPPER, 7, 1)
+            self.assertEqual(self.table.probe(99),
+                             transposition.Entry(2, transposition.UPPER, 7,
+                                                 1))
+        finally:
+            attached.close()
+
+
+class SearcherTest(unittest.TestCase):
+    """The search on boards small enough for all the moves to be tried."""
+
+    def test_search_matches_negamax(self):
+        rng = random.Random(0)
+        table = transposition.TranspositionTable.create(1 << 12)
+        try:
+            for stones in (0, 1, 2, 3, 4):
+                for depth in (1, 2, 3):
+                    hexboard = random_position(3, stones, rng)
+                    grid = [row[:] for row in hexboard.grid]
+                    table.clear()
+                    searcher = transposition.Searcher(table)
+                    score, move = searcher.search(hexboard, depth)
+                    self.assertEqual(score, negamax(hexboard, depth))
+                    # The board and the engine are restored
+                    self.assertEqual(hexboard.grid, grid)
+                    self.assertEqual(searcher.engine.grid,
+                                     sum(grid, []))
+                    # The best move has the score of the position
+                    i, j = move
+                    self.assertEqual(hexboard.grid[i][j], hexgame.EMPTY)
+                    hexboard.play(i, j)
+                    self.assertEqual(-negamax(hexboard, depth - 1)
+                                     if not hexboard.winner
+                                     else transposition.WIN, score)
+        finally:
+            table.close()
+
+    def test_iterate_reuses_table(self):
+        rng = random.Random(1)
+        hexboard = random_position(5, 4, rng)
+        table = transposition.TranspositionTable.create(1 << 14)
+        try:
+            searcher = transposition.Searcher(table)
+            searcher.iterate(hexboard, 2)
+            nodes = searcher.nodes
+            # The same search again: its root is found in the table
+            searcher.search(hexboard, 2)
+            self.assertEqual(searcher.nodes, nodes + 1)
+        finally:
+            table.close()
+
+    def test_iterate_depth(self):
+        table = transposition.TranspositionTable.create(1 << 10)
+        try:
+            searcher = transposition.Searcher(table)
+            hexboard = hexgame.Hex(3)
+            self.assertEqual(searcher.iterate(hexboard, 1),
+                             searcher.search(hexboard, 1))
+            for depth in (0, -1):
+                with self.assertRaises(ValueError):
+                    searcher.iterate(hexboard, depth)
+        finally:
+            table.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
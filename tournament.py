@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+
+"""
+This module runs tournaments between a roster of clients, on one or
+several board sizes. Each match is a session of games between two
+clients, played by a server and two client subprocesses on a port of
+its own, so that several matches run concurrently (--workers).
+
+Pairings are either a round-robin (every pair of clients meets once on
+each board size) or a Swiss system (--rounds rounds, where clients of
+similar scores meet). Elo ratings are updated after each game, and
+every finished match is appended to the results file (JSON lines):
+when the tournament is started again with the same results file, the
+finished matches are skipped and the ratings are replayed from it.
+The matches which did not play all their games (killed after
+--match-timeout seconds, or a client which failed) are reported as
+failed and not saved, so that they are played again on resumption.
+"""
+
+
+from subprocess import Popen, PIPE, DEVNULL, TimeoutExpired
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+
+import runner
+
+
+SERVER_PATH = './hexgame_server.py'
+BASE_PORT = 9000
+INITIAL_RATING = 1500
+K_FACTOR = 16
+CLIENT_GRACE = 5  # Seconds given to the clients to exit after a match
+MATCH_TIMEOUT = 600  # Seconds after which a match is killed
+LOG_LEVEL = logging.INFO
+
+
+class Elo():
+    """The Elo class maintains the Elo ratings of the clients."""
+
+    def __init__(self, names):
+        self.ratings = {name: INITIAL_RATING for name in names}
+
+    def expected(self, first, second):
+        """Returns the expected score of first against second."""
+        return 1 / (1 + 10 ** ((self.ratings[second]
+                                - self.ratings[first]) / 400))
+
+    def update(self, winner, loser):
+        """Updates the ratings after a game."""
+        delta = K_FACTOR * (1 - self.expected(winner, loser))
+        self.ratings[winner] += delta
+        self.ratings[loser] -= delta
+
+
+class Tournament():
+    """
+    The Tournament class holds the roster, the finished matches and
+    the ratings, and appends the results to the results file.
+    """
+
+    def __init__(self, bots, results_file):
+        self.bots = bots
+        self.results_file = results_file
+        self.elo = Elo(bots)
+        self.scores = {bot: 0 for bot in bots}
+        self.results = {}
+        self.failed = []
+        self.lock = threading.Lock()
+        if os.path.exists(results_file):
+            unknown = set()
+            with open(results_file) as results:
+                for line in results:
+                    if not line.strip():
+                        continue
+                    result = json.loads(line)
+                    # The matches of clients left out of the roster
+                    # are not replayed
+                    missing = set(result['bots']) - set(bots)
+                    if missing:
+                        unknown |= missing
+                        continue
+                    self._account(result)
+            if unknown:
+                logging.warning("Skipping the matches of clients not in "
+                                "the roster: %s", ', '.join(sorted(unknown)))
+            logging.info("Resuming after %d finished matches",
+                         len(self.results))
+
+    def _account(self, result):
+        self.results[result['id']] = result
+        for winner in result['games']:
+            loser = result['bots'][1 - winner]
+            self.elo.update(result['bots'][winner], loser)
+            self.scores[result['bots'][winner]] += 1
+
+    def record(self, result):
+        """Accounts for a finished match and saves it."""
+        with self.lock:
+            self._account(result)
+            result['ratings'] = dict(self.elo.ratings)
+            with open(self.results_file, 'a') as results:
+                results.write(json.dumps(result) + "\n")
+
+    def previous_results(self, round_number):
+        """Returns the results of the matches of the previous rounds."""
+        return [result for result in self.results.values()
+                if result['round'] < round_number]
+
+    def scores_before(self, round_number):
+        """Returns the number of games won before the given round."""
+        scores = {bot: 0 for bot in self.bots}
+        for result in self.previous_results(round_number):
+            for winner in result['games']:
+                scores[result['bots'][winner]] += 1
+        return scores
+
+    def played_before(self, first, second, round_number):
+        """Returns True if the two clients met before the given round."""
+        return any(set(result['bots']) == {first, second}
+                   for result in self.previous_results(round_number))
+
+    def standings(self):
+        """Returns the clients sorted by decreasing rating."""
+        return sorted(self.bots, key=lambda bot: -self.elo.ratings[bot])
+
+
+def match_id(round_number, size, first, second):
+    """Returns the identifier of a match, used to resume tournaments."""
+    return "{}-{}-{}-{}".format(round_number, size, first, second)
+
+
+def round_robin(bots, sizes):
+    """Returns all the matches of a round-robin tournament."""
+    return [(match_id(0, size, first, second), 0, size, first, second)
+            for size in sizes
+            for index, first in enumerate(bots)
+            for second in bots[index + 1:]]
+
+
+def swiss_round(tournament, sizes, round_number):
+    """
+    Returns the matches of a Swiss round: clients are sorted by score
+    and paired with the next client they have not met yet. With an odd
+    number of clients, the last one is left out for this round.
+    Only the previous rounds are considered, so that the pairings are
+    the same when a tournament is resumed.
+    """
+    scores = tournament.scores_before(round_number)
+    ranking = sorted(tournament.bots, key=lambda bot: (-scores[bot], bot))
+    pairs = []
+    while len(ranking) > 1:
+        first = ranking.pop(0)
+        second = next((bot for bot in ranking
+                       if not tournament.played_before(first, bot,
+                                                       round_number)),
+                      ranking[0])
+        ranking.remove(second)
+        pairs.append((first, second))
+    return [(match_id(round_number, size, first, second),
+             round_number, size, first, second)
+            for size in sizes
+            for first, second in pairs]
+
+
+def play_match(match, port, games, server_args, timeout=MATCH_TIMEOUT):
+    """
+    Plays a match as subprocesses on the given port.
+    Returns the list of the winners (0 or 1, index in the match).
+    If the match lasts more than timeout seconds (None for no limit),
+    the server is killed and only the finished games are returned.
+    """
+    identifier, _, size, first, second = match
+    winners = []
+    command = ([sys.executable, SERVER_PATH, str(size), '--port', str(port),
+                '--games', str(games)] + server_args)
+    with Popen(command, stdout=PIPE) as server:
+        timer = threading.Timer(timeout, server.kill) if timeout else None
+        if timer:
+            timer.start()
+        clients, peernames, players = [], [], None
+        while server.poll() is None:
+            line = server.stdout.readline().decode()
+            if not line:
+                break
+            logging.debug("[Server %d] %s", port, line.rstrip())
+            # The clients are started one after the other, so that
+            # the order of the connections tells which is which
+            if line.startswith('Waiting'):
+                clients.append(Popen([sys.executable, first, '--headless',
+                                      '--port', str(port)],
+                                     stdout=DEVNULL, stderr=DEVNULL))
+            if line.startswith('New player connected'):
+                peernames.append(line[35:].rstrip())
+                if len(clients) == 1:
+                    clients.append(Popen([sys.executable, second,
+                                          '--headless', '--port', str(port)],
+                                         stdout=DEVNULL, stderr=DEVNULL))
+            if line.startswith('Starting game'):
+                players = [s.split('#')[0].strip()
+                           for s in line[15:].split('/')]
+            number = runner.winner_number(line)
+            if number:
+                winner = players[number - 1]
+                winners.append(peernames.index(winner))
+        if timer:
+            timer.cancel()
+        for client in clients:
+            try:
+                client.wait(timeout=CLIENT_GRACE)
+            except TimeoutExpired:
+                client.kill()
+    logging.info("Match %s: %s", identifier, winners)
+    return winners
+
+
+def run_matches(tournament, matches, arguments):
+    """Plays the matches not played yet, concurrently."""
+    ports = queue.Queue()
+    for port in range(arguments.base_port,
+                      arguments.base_port + arguments.workers):
+        ports.put(port)
+    server_args = []
+    if arguments.time:
+        server_args += ['--time', str(arguments.time),
+                        '--increment', str(arguments.increment)]
+
+    def run(match):
+        port = ports.get()
+        try:
+            winners = play_match(match, port, arguments.games, server_args,
+                                 arguments.match_timeout)
+        finally:
+            ports.put(port)
+        if len(winners) != arguments.games:
+            logging.warning("Match %s failed after %d games", match[0],
+                            len(winners))
+            tournament.failed.append(match[0])
+            return
+        tournament.record({'id': match[0], 'round': match[1],
+                           'size': match[2], 'bots': [match[3], match[4]],
+                           'games': winners})
+
+    todo = [match for match in matches if match[0] not in tournament.results]
+    with ThreadPoolExecutor(max_workers=arguments.workers) as executor:
+        for future in [executor.submit(run, match) for match in todo]:
+            future.result()
+
+
+def main():
+    """Runs a tournament."""
+    logging.basicConfig(level=LOG_LEVEL)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('bots', nargs='+', help='paths of the clients')
+    parser.add_argument('--sizes', nargs='+', default=[11], type=int)
+    parser.add_argument('--format', choices=['roundrobin', 'swiss'],
+                        default='roundrobin')
+    parser.add_argument('--rounds', default=3, type=int,
+                        help='number of rounds of a Swiss tournament')
+    parser.add_argument('--games', default=2, type=int,
+                        help='number of games of each match')
+    parser.add_argument('--workers', default=os.cpu_count() // 2 or 1,
+                        type=int, help='number of concurrent matches')
+    parser.add_argument('--base-port', default=BASE_PORT, type=int)
+    parser.add_argument('--time', default=None, type=float,
+                        help='time bank of each player, in seconds')
+    parser.add_argument('--increment', default=0, type=float)
+    parser.add_argument('--match-timeout', default=MATCH_TIMEOUT, type=float,
+                        help='kill the matches lasting longer, in seconds '
+                        '(0 for no limit)')
+    parser.add_argument('--results', default='tournament.jsonl')
+    arguments = parser.parse_args(sys.argv[1:])
+    if len(set(arguments.bots)) != len(arguments.bots):
+        parser.error('the clients of the roster must be distinct')
+
+    tournament = Tournament(arguments.bots, arguments.results)
+    if arguments.format == 'roundrobin':
+        run_matches(tournament,
+                    round_robin(arguments.bots, arguments.sizes), arguments)
+    else:
+        for round_number in range(1, arguments.rounds + 1):
+            logging.info("### Round %d", round_number)
+            run_matches(tournament,
+                        swiss_round(tournament, arguments.sizes,
+                                    round_number), arguments)
+
+    for bot in tournament.standings():
+        print('{:7.1f} {:4d} {}'.format(tournament.elo.ratings[bot],
+                                        tournament.scores[bot], bot))
+    if tournament.failed:
+        print('Failed matches (played again when resumed): {}'.format(
+            ', '.join(tournament.failed)))
+
+
+if __name__ == '__main__':
+    main()
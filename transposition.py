@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+
+"""
+This module implements a transposition table in shared memory, so
+that the processes searching the same position share their results,
+and a parallel search using it.
+
+The table is a fixed array of buckets in a multiprocessing
+SharedMemory block. Each bucket holds two entries of two 64-bit
+words: the packed record (best move, score, depth and bound), and the
+position key XORed with the record. No lock is taken: a record torn
+by two concurrent writes no longer matches its key, and is ignored.
+The first entry of a bucket keeps the deepest result, the second one
+the most recent.
+
+The positions are identified by a 64-bit hash of their canonical key
+(see Hex.canonical_key), so that symmetric positions share their
+entries; the best moves are stored in the canonical position. A table
+is pickled as the name of its memory block, so it can be passed to
+worker processes, which attach to the same memory.
+
+When run, this module searches a position with a negamax on several
+processes sharing a table (lazy SMP): each worker searches the whole
+tree, with a different move ordering, and finds in the table the
+results of the others. The leaves are evaluated by the distances of
+the players to their edges (see distances.py), kept by a single
+engine per searcher: the stones are placed and removed as the search
+moves down and back up the tree.
+"""
+
+
+import argparse
+import collections
+import hashlib
+import multiprocessing
+from multiprocessing import shared_memory
+import os
+import random
+import sys
+import time
+
+import distances
+import hexgame
+
+
+EXACT, LOWER, UPPER = 1, 2, 3
+NO_MOVE = 0xFFFF
+DEFAULT_ENTRIES = 1 << 20
+ENTRY_WORDS = 2
+BUCKET_WORDS = 2 * ENTRY_WORDS
+WORD_BYTES = 8
+# The fields of a record: move (16 bits), score (signed, 16 bits),
+# depth (8 bits) and bound (2 bits, never 0 in a stored record)
+SCORE_SHIFT, DEPTH_SHIFT, BOUND_SHIFT = 16, 32, 40
+
+WIN = 10000
+SCALE = 100  # Score of a distance difference of one cell
+BRANCHING = 10  # Moves searched at each node
+
+Entry = collections.namedtuple('Entry', ['depth', 'bound', 'score', 'move'])
+
+
+def position_key(hexboard):
+    """
+    Returns the 64-bit key of a position, and the symmetry mapping it
+    to its canonical position.
+    """
+    key, transform = hexboard.canonical_key()
+    digest = hashlib.blake2b(key, digest_size=WORD_BYTES).digest()
+    return int.from_bytes(digest, 'little'), transform
+
+
+def pack(depth, bound, score, move):
+    """Returns the 64-bit record of an entry."""
+    return (move | (score & 0xFFFF) << SCORE_SHIFT
+            | depth << DEPTH_SHIFT | bound << BOUND_SHIFT)
+
+
+def unpack(data):
+    """Returns the Entry of a 64-bit record."""
+    score = data >> SCORE_SHIFT & 0xFFFF
+    return Entry(data >> DEPTH_SHIFT & 0xFF, data >> BOUND_SHIFT & 0x3,
+                 score - 0x10000 if score & 0x8000 else score,
+                 data & 0xFFFF)
+
+
+class TranspositionTable():
+    """
+    The TranspositionTable class stores search results in shared
+    memory. Use create() in the main process, and pass the table to
+    the workers (or attach() to it by name).
+    """
+
+    def __init__(self, memory, buckets, owner=False):
+        self.memory = memory
+        self.buckets = buckets
+        self.mask = buckets - 1
+        self.owner = owner
+        self.words = memory.buf.cast('Q')
+        self.probes = 0
+        self.hits = 0
+
+    @staticmethod
+    def create(entries=DEFAULT_ENTRIES, name=None):
+        """
+        Creates a table of at least the given number of entries (two
+        per bucket, a power of two of buckets).
+        """
+        buckets = 1
+        while 2 * buckets < entries:
+            buckets *= 2
+        memory = shared_memory.SharedMemory(
+            name, create=True, size=buckets * BUCKET_WORDS * WORD_BYTES)
+        return TranspositionTable(memory, buckets, owner=True)
+
+    @staticmethod
+    def attach(name, buckets):
+        """Attaches to the table created with the given memory name."""
+        return TranspositionTable(shared_memory.SharedMemory(name), buckets)
+
+    def __reduce__(self):
+        return TranspositionTable.attach, (self.memory.name, self.buckets)
+
+    def probe(self, key):
+        """Returns the Entry of a position key, or None."""
+        self.probes += 1
+        words = self.words
+        base = (key & self.mask) * BUCKET_WORDS
+        for slot in (base, base + ENTRY_WORDS):
+            data = words[slot + 1]
+            if data and words[slot] ^ data == key:
+                self.hits += 1
+                return unpack(data)
+        return None
+
+    def store(self, key, depth, bound, score, move=NO_MOVE):
+        """
+        Stores the result of a search.
+
+        Arguments:
+        - The position key.
+        - The depth of the search.
+        - The bound: EXACT, LOWER (the score is at least the given
+          one) or UPPER (at most the given one).
+        - The score, between -32768 and 32767.
+        - The best move (a cell index), or NO_MOVE.
+        """
+        words = self.words
+        base = (key & self.mask) * BUCKET_WORDS
+        data = pack(min(depth, 0xFF), bound, score, move)
+        # A shallower result, even of the same position, goes to the
+        # second entry: the deeper one is kept in the first
+        if depth >= words[base + 1] >> DEPTH_SHIFT & 0xFF:
+            slot = base
+        else:
+            slot = base + ENTRY_WORDS
+        words[slot] = key ^ data
+        words[slot + 1] = data
+
+    def clear(self):
+        """Empties the table."""
+        self.memory.buf[:] = bytes(self.memory.size)
+
+    def close(self):
+        """Detaches the table; its creator also frees the memory."""
+        self.words.release()
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+class Searcher():
+    """
+    The Searcher class implements an alpha-beta negamax with iterative
+    deepening, sharing its results through a transposition table.
+    """
+
+    def __init__(self, table, rng=None):
+        self.table = table
+        self.rng = rng
+        self.nodes = 0
+        self.engine = None
+
+    def _moves(self, hexboard, engine, adversary):
+        """Returns the most promising moves, best first."""
+        size = hexboard.size
+        cap = size * size
+        scores = []
+        for i in range(size):
+            for j in range(size):
+                if hexboard.grid[i][j] == hexgame.EMPTY:
+                    score = (min(engine.through(hexboard.current, i, j), cap)
+                             + min(engine.through(adversary, i, j), cap))
+                    # Helpers shuffle the moves of equal scores
+                    noise = self.rng.random() if self.rng else 0
+                    center = abs(2 * i - size + 1) + abs(2 * j - size + 1)
+                    scores.append((score, noise, center, i, j))
+        scores.sort()
+        return [(i, j) for _, _, _, i, j in scores[:BRANCHING]]
+
+    def search(self, hexboard, depth, alpha=-WIN, beta=WIN):
+        """
+        Returns the score of a position for the player to move, and
+        its best move (None at the leaves). The board is modified
+        during the search, and restored.
+        """
+        if self.engine is None or self.engine.size != hexboard.size:
+            self.engine = distances.DistanceEngine(hexboard.size)
+        self.engine.sync(hexboard)
+        return self._search(hexboard, depth, alpha, beta)
+
+    def _search(self, hexboard, depth, alpha, beta):
+        """Searches a position whose stones are those of the engine."""
+        self.nodes += 1
+        key, transform = position_key(hexboard)
+        entry = self.table.probe(key)
+        table_move = None
+        if entry:
+            if entry.move != NO_MOVE:
+                table_move = hexboard.transform_move(
+                    transform, *divmod(entry.move, hexboard.size))
+            if entry.depth >= depth and (
+                    entry.bound == EXACT
+                    or entry.bound == LOWER and entry.score >= beta
+                    or entry.bound == UPPER and entry.score <= alpha):
+                return entry.score, table_move
+
+        player = hexboard.current
+        adversary = hexgame.RED if player == hexgame.BLUE else hexgame.BLUE
+        engine = self.engine
+        own, other = engine.distance(player), engine.distance(adversary)
+        if other == 0:
+            return -WIN, None
+        if own == 0:
+            return WIN, None
+        if depth == 0:
+            return max(-WIN + 1, min(WIN - 1, (other - own) * SCALE)), None
+
+        moves = self._moves(hexboard, engine, adversary)
+        if table_move in moves:
+            moves.remove(table_move)
+        # A different position may have the same key
+        if table_move and hexboard.grid[table_move[0]][table_move[1]] \
+                == hexgame.EMPTY:
+            moves.insert(0, table_move)
+        best, best_move, original_alpha = -WIN - 1, None, alpha
+        for i, j in moves:
+            hexboard.grid[i][j] = player
+            hexboard.current = adversary
+            engine.place(i, j, player)
+            score = -self._search(hexboard, depth - 1, -beta, -alpha)[0]
+            engine.remove(i, j)
+            hexboard.grid[i][j] = hexgame.EMPTY
+            hexboard.current = player
+            if score > best:
+                best, best_move = score, (i, j)
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+
+        bound = (UPPER if best <= original_alpha
+                 else LOWER if best >= beta else EXACT)
+        # The symmetries are their own inverses
+        i, j = hexboard.transform_move(transform, *best_move)
+        self.table.store(key, depth, bound, best, i * hexboard.size + j)
+        return best, best_move
+
+    def iterate(self, hexboard, depth):
+        """Searches at increasing depths, returns the last result."""
+        if depth < 1:
+            raise ValueError("The depth must be at least 1")
+        for current_depth in range(1, depth + 1):
+            result = self.search(hexboard, current_depth)
+        return result
+
+
+def search_worker(job):
+    """Searches a position in a worker process, see main."""
+    table, board, depth, seed = job
+    searcher = Searcher(table, random.Random(seed) if seed else None)
+    try:
+        score, move = searcher.iterate(hexgame.Hex.create_from_str(board),
+                                       depth)
+    finally:
+        table.close()
+    return score, move, searcher.nodes, table.hits, table.probes
+
+
+def main():
+    """Searches a position with several processes sharing a table."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('board', nargs='?', default=None,
+                        help='serialized board (empty by default)')
+    parser.add_argument('--size', default=7, type=int)
+    parser.add_argument('--depth', default=3, type=int)
+    parser.add_argument('--workers', default=os.cpu_count(), type=int)
+    parser.add_argument('--entries', default=DEFAULT_ENTRIES, type=int)
+    arguments = parser.parse_args(sys.argv[1:])
+    if arguments.depth < 1:
+        parser.error('the depth must be at least 1')
+    board = arguments.board or hexgame.Hex(arguments.size).serialize()
+
+    table = TranspositionTable.create(arguments.entries)
+    try:
+        start = time.perf_counter()
+        with multiprocessing.Pool(arguments.workers) as pool:
+            # The first worker keeps the plain move ordering
+            results = pool.map(search_worker,
+                               [(table, board, arguments.depth, seed)
+                                for seed in range(arguments.workers)])
+        elapsed = time.perf_counter() - start
+    finally:
+        table.close()
+    for worker, (score, move, nodes, hits, probes) in enumerate(results):
+        print("Worker {}: move {} score {} nodes {} hits {}/{}".format(
+            worker, move, score, nodes, hits, probes))
+    score, move = results[0][:2]
+    print("Best move {}#{} (score {}), {} nodes in {:.2f}s".format(
+        move[0], move[1], score, sum(result[2] for result in results),
+        elapsed))
+
+
+if __name__ == '__main__':
+    main()